@@ -1,11 +1,29 @@
 """Explore Punto Farma website structure."""
 
 import asyncio
+import os
+import re
 from playwright.async_api import async_playwright
 
+# Headed browser + 30 s pause only when inspecting by hand: EXPLORE_HEADED=1
+HEADED = os.getenv("EXPLORE_HEADED") == "1"
+
+# Look for common e-commerce patterns
+PATTERNS = [
+    "medicamentos",
+    "productos",
+    "catalog",
+    "shop",
+    "store",
+    "farma",
+    "product",
+]
+# One case-insensitive pass over the HTML instead of a substring search per keyword
+PATTERN_RE = re.compile("|".join(map(re.escape, PATTERNS)), re.IGNORECASE)
+
 async def explore():
     async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=False)
+        browser = await p.chromium.launch(headless=not HEADED)
         page = await browser.new_page()
 
         print("=" * 60)
@@ -15,7 +33,7 @@ async def explore():
         # Visit homepage
         print("\n1. Visiting homepage...")
         await page.goto("https://www.puntofarma.com.py")
-        await page.wait_for_timeout(3000)
+        await page.wait_for_load_state("domcontentloaded")
 
         title = await page.title()
         print(f"   Title: {title}")
@@ -24,46 +42,39 @@ async def explore():
         print("\n2. Looking for navigation/categories...")
 
         # Try common selectors
-        nav_links = await page.locator("nav a, .menu a, .category a").all()
+        # Text and href of every link in one round trip
+        nav_links = await page.locator("nav a, .menu a, .category a").evaluate_all(
+            "links => links.map((a) => [a.textContent, a.getAttribute('href')])"
+        )
         print(f"   Found {len(nav_links)} navigation links")
 
         if len(nav_links) > 0:
             print("\n   First 10 links:")
-            for i, link in enumerate(nav_links[:10]):
-                text = await link.text_content()
-                href = await link.get_attribute("href")
-                print(f"   [{i+1}] {text.strip()} -> {href}")
+            for i, (text, href) in enumerate(nav_links[:10]):
+                print(f"   [{i+1}] {(text or '').strip()} -> {href}")
 
         # Look for search or category pages
         print("\n3. Checking for product catalog/search...")
 
         # Try to find products or catalog
-        product_links = await page.locator("a[href*='product'], a[href*='producto'], .product a, .item a").all()
-        print(f"   Found {len(product_links)} potential product links")
+        product_link_count = await page.locator("a[href*='product'], a[href*='producto'], .product a, .item a").count()
+        print(f"   Found {product_link_count} potential product links")
 
         # Check page source for clues
         print("\n4. Checking page structure...")
         html = await page.content()
 
-        # Look for common e-commerce patterns
-        patterns = [
-            "medicamentos",
-            "productos",
-            "catalog",
-            "shop",
-            "store",
-            "farma",
-            "product",
-        ]
-
         print("   Keywords found in HTML:")
-        for pattern in patterns:
-            if pattern in html.lower():
+        found = {match.group(0).lower() for match in PATTERN_RE.finditer(html)}
+        for pattern in PATTERNS:
+            # "product" may only have matched as part of "productos"
+            if any(pattern in match for match in found):
                 print(f"   ✓ {pattern}")
 
-        print("\n5. Waiting for user to explore...")
-        print("   Browser will stay open for 30 seconds for manual inspection")
-        await page.wait_for_timeout(30000)
+        if HEADED:
+            print("\n5. Waiting for user to explore...")
+            print("   Browser will stay open for 30 seconds for manual inspection")
+            await page.wait_for_timeout(30000)
 
         await browser.close()
 
@@ -1,20 +1,40 @@
 """Extract and pretty-print JSON from Punto Farma API response."""
 
+import mmap
 import re
+import sys
 import json
 
-with open("punto_farma_page_1_response.txt", "r") as f:
-    response_text = f.read()
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Find the JSON object that starts with "1:{"
-match = re.search(r'1:(\{"ok".*\})', response_text)
-if match:
-    json_str = match.group(1)
-    data = json.loads(json_str)
+JSON_RE = re.compile(rb'1:(\{"ok".*\})')
 
-    print("=" * 80)
-    print("PUNTO FARMA API RESPONSE - FULL JSON STRUCTURE")
-    print("=" * 80)
-    print(json.dumps(data, indent=2, ensure_ascii=False))
+# Indent only for humans; piping to jq or a file gets compact output
+pretty = sys.stdout.isatty()
+
+# Scan the dump via mmap instead of reading it all into a str
+with open("punto_farma_page_1_response.txt", "rb") as f, \
+        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+    match = JSON_RE.search(mm)
+    json_bytes = match.group(1) if match else None
+
+if json_bytes:
+    if pretty:
+        print("=" * 80)
+        print("PUNTO FARMA API RESPONSE - FULL JSON STRUCTURE")
+        print("=" * 80)
+        sys.stdout.flush()
+
+    if orjson:
+        data = orjson.loads(json_bytes)
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        sys.stdout.buffer.write(orjson.dumps(data, option=option) + b"\n")
+    else:
+        data = json.loads(json_bytes)
+        print(json.dumps(data, indent=2 if pretty else None, ensure_ascii=False))
 else:
     print("No JSON found")
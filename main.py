@@ -1,9 +1,28 @@
 """Main entry point for Apify Actor - runs selected pharmacy scrapers."""
 
 import asyncio
+import importlib
 import os
 from apify import Actor
-from scrapers import farma_oliva, punto_farma, farmacia_center, farmacia_catedral
+
+# pharmacy -> (scraper module, actor input key for its phase, display name)
+# Modules are imported on demand so a single-pharmacy run only loads its own scraper
+SCRAPERS = {
+    'farma_oliva': ('scrapers.farma_oliva', None, 'Farma Oliva'),
+    'punto_farma': ('scrapers.punto_farma', 'punto_farma_phase', 'Punto Farma'),
+    'farmacia_center': ('scrapers.farmacia_center', 'farma_center_phase', 'Farmacia Center'),
+    'farmacia_catedral': ('scrapers.farmacia_catedral', 'farma_catedral_phase', 'Farmacia Catedral'),
+}
+
+
+async def run_scraper(pharmacy: str, actor_input: dict) -> None:
+    """Import and run one pharmacy scraper with its phase from the actor input."""
+    module_name, phase_key, _ = SCRAPERS[pharmacy]
+    scraper = importlib.import_module(module_name)
+    if phase_key:
+        await scraper.main(phase=actor_input.get(phase_key, 'phase1'))
+    else:
+        await scraper.main()
 
 
 async def main():
@@ -12,37 +31,21 @@ async def main():
         # Get input from Apify
         actor_input = await Actor.get_input() or {}
         pharmacy = actor_input.get('pharmacy', 'all')
-        punto_farma_phase = actor_input.get('punto_farma_phase', 'phase1')
-        farma_center_phase = actor_input.get('farma_center_phase', 'phase1')
-        farma_catedral_phase = actor_input.get('farma_catedral_phase', 'phase1')
 
         Actor.log.info(f"Starting scraper for: {pharmacy}")
-        if pharmacy == 'punto_farma':
-            Actor.log.info(f"Punto Farma phase: {punto_farma_phase}")
-        elif pharmacy == 'farmacia_center':
-            Actor.log.info(f"Farmacia Center phase: {farma_center_phase}")
-        elif pharmacy == 'farmacia_catedral':
-            Actor.log.info(f"Farmacia Catedral phase: {farma_catedral_phase}")
+        if pharmacy in SCRAPERS:
+            _, phase_key, display_name = SCRAPERS[pharmacy]
+            if phase_key:
+                Actor.log.info(f"{display_name} phase: {actor_input.get(phase_key, 'phase1')}")
 
         # Run selected scraper(s)
         if pharmacy == 'all':
             Actor.log.info("Running all pharmacy scrapers sequentially...")
-            await farma_oliva.main()
-            await punto_farma.main(phase=punto_farma_phase)
-            await farmacia_center.main(phase=farma_center_phase)
-            await farmacia_catedral.main(phase=farma_catedral_phase)
-
-        elif pharmacy == 'farma_oliva':
-            await farma_oliva.main()
-
-        elif pharmacy == 'punto_farma':
-            await punto_farma.main(phase=punto_farma_phase)
-
-        elif pharmacy == 'farmacia_center':
-            await farmacia_center.main(phase=farma_center_phase)
+            for name in SCRAPERS:
+                await run_scraper(name, actor_input)
 
-        elif pharmacy == 'farmacia_catedral':
-            await farmacia_catedral.main(phase=farma_catedral_phase)
+        elif pharmacy in SCRAPERS:
+            await run_scraper(pharmacy, actor_input)
 
         else:
             Actor.log.error(f"Unknown pharmacy: {pharmacy}")
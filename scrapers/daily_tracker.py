@@ -5,47 +5,132 @@ Designed for GitHub Actions daily runs.
 """
 
 import asyncio
+import uuid
+import os
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from crawlee import ConcurrencySettings
-from crawlee.crawlers import PlaywrightCrawler, PlaywrightCrawlingContext
+from typing import Callable, Optional
+from crawlee import ConcurrencySettings, Request
+from crawlee.crawlers import (
+    BeautifulSoupCrawler,
+    BeautifulSoupCrawlingContext,
+    PlaywrightCrawler,
+    PlaywrightCrawlingContext,
+    PlaywrightPreNavCrawlingContext,
+)
+from crawlee.storages import RequestQueue
 from bs4 import BeautifulSoup
-import json
-from storage.supabase_loader import SupabaseLoader
+import httpx
+from storage.supabase_loader import BatchWriter, SupabaseLoader
+from utils.config import PHARMACY_URLS
+from utils.crawling import (
+    BLOCKED_MEDIA_TYPES,
+    BLOCKED_RESOURCE_TYPES,
+    block_heavy_resources,
+    build_browser_pool,
+    restore_storage_state,
+    save_storage_state,
+    storage_state_path,
+    wait_for_text,
+)
+from utils.parsing import HTML_PARSER, css, json_loads, make_soup, parse_guarani, select_text
 from utils.logger import get_logger
 
 logger = get_logger()
 
+# Crawl limits (override via env on constrained runners)
+CRAWL_CONCURRENT_REQUESTS = int(os.getenv("CRAWL_CONCURRENT_REQUESTS", "16"))
+# Max requests in flight against a single pharmacy host in the HTTP phase (one crawler per host)
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "4"))
+# Max pages open at once in the shared browser phase (keep within CRAWLEE_MEMORY_MBYTES)
+MAX_CONCURRENT_PAGES = int(os.getenv("MAX_CONCURRENT_PAGES", "16"))
+# Pharmacies crawled at once in the HTTP phase (0 = all of them)
+PHARMACY_PARALLELISM = int(os.getenv("PHARMACY_PARALLELISM", "0"))
 
-async def get_daily_tracking_urls(loader: SupabaseLoader) -> dict:
+# Politeness caps in requests/minute per host; throughput is bounded by these,
+# not by process concurrency. Crawlee sizes memory from CRAWLEE_MEMORY_MBYTES.
+MAX_TASKS_PER_MINUTE = {
+    "farma_oliva": 120,
+    "punto_farma": 240,
+    "farma_center": 240,
+    "farmacia_catedral": 240,
+}
+DEFAULT_MAX_TASKS_PER_MINUTE = 120
+
+# Skip pages that answer 304 Not Modified (needs sql/create_product_http_cache.sql)
+CONDITIONAL_FETCH = os.getenv("CONDITIONAL_FETCH", "0") == "1"
+
+
+def _parse_price(price_text: str | None) -> int | None:
+    """Parse a guaraní price string such as "₲. 59.400 *" into 59400."""
+    price = parse_guarani(price_text)
+    if price is None and price_text:
+        # e.g. "Consultar": the element holds no amount at all
+        logger.warning(f"Unparseable price: {price_text!r}")
+    return price
+
+
+# PostgREST caps responses at 1000 rows, so page through larger tables
+TRACKING_URLS_PAGE_SIZE = 1000
+
+
+async def iter_tracking_url_pages(loader: SupabaseLoader, pharmacy_filter: Optional[str] = None):
+    """
+    Yield barcode_tracking_urls rows one page at a time.
+
+    Args:
+        loader: Supabase loader
+        pharmacy_filter: Only fetch rows for this pharmacy_source
+
+    Yields:
+        Lists of up to TRACKING_URLS_PAGE_SIZE rows
+    """
+    offset = 0
+    while True:
+        query = loader.client.table("barcode_tracking_urls").select(
+            "pharmacy_source, product_url, site_code, barcode"
+        )
+        if pharmacy_filter:
+            query = query.eq("pharmacy_source", pharmacy_filter)
+        query = query.order("product_url").range(offset, offset + TRACKING_URLS_PAGE_SIZE - 1)
+
+        # On the loader's sized executor, so DB concurrency stays under SUPABASE_MAX_CONNECTIONS
+        response = await loader._execute(query)
+        rows = response.data or []
+        if rows:
+            yield rows
+        if len(rows) < TRACKING_URLS_PAGE_SIZE:
+            return
+        offset += TRACKING_URLS_PAGE_SIZE
+
+
+async def get_daily_tracking_urls(loader: SupabaseLoader, pharmacy_filter: Optional[str] = None) -> dict:
     """
     Get URLs from barcode_tracking_urls table.
 
+    Args:
+        loader: Supabase loader
+        pharmacy_filter: Only fetch URLs for this pharmacy (filtered in Postgres)
+
     Returns:
         Dict with pharmacy_source as keys, list of URLs as values
     """
     logger.info("Fetching URLs from barcode_tracking_urls table...")
 
     try:
-        # Query barcode_tracking_urls table
-        response = loader.client.table("barcode_tracking_urls").select(
-            "pharmacy_source, product_url, site_code, barcode"
-        ).execute()
-
-        urls = response.data if response.data else []
-        logger.info(f"Found {len(urls)} URLs to track")
-
         # Group by pharmacy
         by_pharmacy = {}
-        for url_record in urls:
-            pharmacy = url_record["pharmacy_source"]
-            if pharmacy not in by_pharmacy:
-                by_pharmacy[pharmacy] = []
-
-            by_pharmacy[pharmacy].append({
-                "url": url_record["product_url"],
-                "site_code": url_record.get("site_code"),
-                "barcode": url_record.get("barcode"),
-            })
+        total = 0
+        async for rows in iter_tracking_url_pages(loader, pharmacy_filter):
+            total += len(rows)
+            for url_record in rows:
+                by_pharmacy.setdefault(url_record["pharmacy_source"], []).append({
+                    "url": url_record["product_url"],
+                    "site_code": url_record.get("site_code"),
+                    "barcode": url_record.get("barcode"),
+                })
+
+        logger.info(f"Found {total} URLs to track")
 
         # Log summary
         for pharmacy, urls_list in by_pharmacy.items():
@@ -59,373 +144,440 @@ async def get_daily_tracking_urls(loader: SupabaseLoader) -> dict:
 
 
 # ============================================================================
-# FARMA OLIVA HANDLER
+# PARSERS
 # ============================================================================
 
-async def scrape_farma_oliva(context: PlaywrightCrawlingContext, loader: SupabaseLoader, product_info: dict):
-    """Scrape Farma Oliva product page."""
-    page = context.page
-    url = context.request.url
+@dataclass(frozen=True, slots=True)
+class SelectorSpec:
+    """Where each tracked field lives on one pharmacy's product page."""
+
+    ready_sel: str  # Element the browser waits for before parsing
+    name_sel: str
+    price_sel: str
+    original_price_sel: Optional[str] = None
+    brand_sel: Optional[str] = None
+    code_sel: Optional[str] = None
+    barcode_sel: Optional[str] = None
+    # Wait for ready_sel's text to match this JS regex (for values filled in by JavaScript)
+    ready_pattern: Optional[str] = None
+    # Resource types aborted when the page is rendered in the browser
+    blocked_resources: frozenset = BLOCKED_RESOURCE_TYPES
+    # Site-specific fix-ups applied after the generic fields: (soup, product_data, product_info)
+    special: Optional[Callable[[BeautifulSoup, dict, dict], None]] = None
+
+
+def farma_oliva_brand(soup: BeautifulSoup, product_data: dict, product_info: dict) -> None:
+    """Farma Oliva lists the brand as a "Marca ..." breadcrumb."""
+    for crumb in css("a.breadcrumb-item").select(soup):
+        text = crumb.get_text(strip=True)
+        if "Marca" in text:
+            product_data["brand"] = text.replace("Marca", "").strip()
+            break
+
+
+def farmacia_center_codes(soup: BeautifulSoup, product_data: dict, product_info: dict) -> None:
+    """Farmacia Center shows "site_code-barcode" together and hides the brand in data-tit."""
+    codigo_text = css("div.cod_bar").select_one(soup)
+    if codigo_text:
+        codigo = codigo_text.get_text(strip=True)
+        if "-" in codigo:
+            parts = codigo.split("-")
+            product_data["site_code"] = parts[0]
+            product_data["barcode"] = parts[1] if len(parts) > 1 else None
+
+    brand_elem = css("[data-tit]").select_one(soup)
+    if brand_elem:
+        tit = brand_elem.get("data-tit", "")
+        if "Medicamentos" in tit or "MEDICAMENTOS" in tit:
+            product_data["brand"] = tit.split()[-1]
+
+
+def farmacia_catedral_jsonld(soup: BeautifulSoup, product_data: dict, product_info: dict) -> None:
+    """Farmacia Catedral embeds JSON-LD, which takes priority over the HTML fields."""
+    json_ld = css('script[type="application/ld+json"]').select_one(soup)
+    if not json_ld:
+        return
 
+    url = product_data["product_url"]
     try:
-        await page.wait_for_load_state("networkidle", timeout=10000)
-        content = await page.content()
-        soup = BeautifulSoup(content, "html.parser")
+        data = json_loads(json_ld.string)
+        product_data["product_name"] = data.get("name") or product_data["product_name"]
+        product_data["barcode"] = data.get("gtin13") or product_info.get("barcode")
+        product_data["site_code"] = data.get("sku") or product_info.get("site_code")
+        product_data["brand"] = data.get("brand", {}).get("name")
 
-        # Product name
-        product_name = soup.select_one(".single-product-header h1.product_title")
-        product_name = product_name.get_text(strip=True) if product_name else None
+        # Price
+        offers = data.get("offers", {})
+        price = offers.get("price")
+        if price:
+            try:
+                product_data["current_price"] = int(float(price))
+            except (TypeError, ValueError):
+                logger.warning(f"Unparseable JSON-LD price {price!r} for {url}")
+    except (ValueError, AttributeError) as e:
+        logger.warning(f"Invalid JSON-LD for {url}: {e}")
+
+
+SPECS = {
+    "farma_oliva": SelectorSpec(
+        ready_sel="#producto-precio",
+        ready_pattern=r"\d",
+        # The price script may rely on Oliva's stylesheets, as in farma_oliva.py
+        blocked_resources=BLOCKED_MEDIA_TYPES,
+        name_sel=".single-product-header h1.product_title",
+        price_sel="#producto-precio",
+        original_price_sel="#producto-precio-anterior",
+        code_sel="#producto-codigo",
+        barcode_sel="#producto-ean",
+        special=farma_oliva_brand,
+    ),
+    "punto_farma": SelectorSpec(
+        ready_sel="h1.titulo_titulo__7i65o",
+        name_sel="h1.titulo_titulo__7i65o",
+        price_sel="div.precio_precio__l5AYL",
+        original_price_sel="div.precio_precioTachado__2R9jn",
+        brand_sel="a.category[href*='/marca/']",
+    ),
+    "farma_center": SelectorSpec(
+        ready_sel="div.tit h1",
+        name_sel="div.tit h1",
+        price_sel="span.precio_venta",
+        original_price_sel="span.precio_lista",
+        special=farmacia_center_codes,
+    ),
+    "farmacia_catedral": SelectorSpec(
+        ready_sel='script[type="application/ld+json"], h1.product-title',
+        name_sel="h1.product-title",
+        price_sel="span.price-final",
+        special=farmacia_catedral_jsonld,
+    ),
+}
+
+
+def parse_product(pharmacy: str, spec: SelectorSpec, soup: BeautifulSoup, url: str, product_info: dict) -> dict:
+    """
+    Parse a tracked product page using its pharmacy's selector spec.
 
-        # Site code
-        site_code = soup.select_one("#producto-codigo")
-        site_code = site_code.get_text(strip=True) if site_code else product_info.get("site_code")
+    Args:
+        pharmacy: Pharmacy source key
+        spec: Selectors for this pharmacy
+        soup: Parsed product page
+        url: Product URL
+        product_info: Row from barcode_tracking_urls (fallback site_code/barcode)
 
-        # Barcode
-        barcode = soup.select_one("#producto-ean")
-        barcode = barcode.get_text(strip=True) if barcode else product_info.get("barcode")
+    Returns:
+        Product data ready for upsert
+    """
+    product_data = {
+        "pharmacy_source": pharmacy,
+        "site_code": select_text(soup, spec.code_sel) or product_info.get("site_code"),
+        "barcode": select_text(soup, spec.barcode_sel) or product_info.get("barcode"),
+        "product_name": select_text(soup, spec.name_sel),
+        "brand": select_text(soup, spec.brand_sel),
+        "product_url": url,
+        "current_price": _parse_price(select_text(soup, spec.price_sel)),
+        "original_price": _parse_price(select_text(soup, spec.original_price_sel)),
+    }
 
-        # Price
-        price_elem = soup.select_one("#producto-precio")
-        current_price = None
-        if price_elem:
-            price_text = price_elem.get_text(strip=True).replace("₲", "").replace(".", "").strip()
-            try:
-                current_price = float(price_text)
-            except:
-                pass
-
-        # Original price
-        original_price_elem = soup.select_one("#producto-precio-anterior")
-        original_price = None
-        if original_price_elem:
-            price_text = original_price_elem.get_text(strip=True).replace("₲", "").replace(".", "").strip()
-            try:
-                original_price = float(price_text)
-            except:
-                pass
-
-        # Brand
-        brand = None
-        breadcrumbs = soup.select("a.breadcrumb-item")
-        for crumb in breadcrumbs:
-            text = crumb.get_text(strip=True)
-            if "Marca" in text:
-                brand = text.replace("Marca", "").strip()
-                break
-
-        product_data = {
-            "pharmacy_source": "farma_oliva",
-            "site_code": site_code,
-            "barcode": barcode,
-            "product_name": product_name,
-            "brand": brand,
-            "product_url": url,
-            "current_price": current_price,
-            "original_price": original_price,
-        }
-
-        product_id = await loader.upsert_product(product_data)
-
-        # Insert daily snapshot for tracking campaign
-        if product_id:
-            product_data["id"] = product_id
-            await loader.insert_barcode_snapshot(product_data)
-
-        logger.info(f"✓ {product_name} - ₲{current_price:,.0f}" if current_price else f"✓ {product_name}")
+    if spec.special:
+        spec.special(soup, product_data, product_info)
 
-    except Exception as e:
-        logger.error(f"Error scraping {url}: {e}")
+    return product_data
 
 
 # ============================================================================
-# PUNTO FARMA HANDLER
+# STORAGE
 # ============================================================================
 
-async def scrape_punto_farma(context: PlaywrightCrawlingContext, loader: SupabaseLoader, product_info: dict):
-    """Scrape Punto Farma product page."""
-    page = context.page
-    url = context.request.url
+async def save_product(writer: BatchWriter, product_data: dict):
+    """Queue a parsed product upsert and its daily snapshot for the next batch."""
+    await writer.add_product(product_data, snapshot=True)
 
-    try:
-        await page.wait_for_load_state("networkidle", timeout=10000)
-        content = await page.content()
-        soup = BeautifulSoup(content, "html.parser")
+    name = product_data.get("product_name")
+    price = product_data.get("current_price")
+    logger.info(f"✓ {name} - ₲{price:,.0f}" if price else f"✓ {name}")
 
-        # Product name
-        product_name = soup.select_one("h1.titulo_titulo__7i65o")
-        product_name = product_name.get_text(strip=True) if product_name else None
 
-        # Site code and barcode
-        site_code = product_info.get("site_code")
-        barcode = product_info.get("barcode")
+async def filter_changed_urls(loader: SupabaseLoader, pharmacy: str, urls: list) -> tuple[list, dict]:
+    """
+    HEAD each URL with its cached validators and drop pages that are unchanged.
 
-        # Price
-        price_elem = soup.select_one("div.precio_precio__l5AYL")
-        current_price = None
-        if price_elem:
-            price_text = price_elem.get_text(strip=True).replace("₲", "").replace(".", "").strip()
-            try:
-                current_price = float(price_text)
-            except:
-                pass
-
-        # Original price
-        original_price_elem = soup.select_one("div.precio_precioTachado__2R9jn")
-        original_price = None
-        if original_price_elem:
-            price_text = original_price_elem.get_text(strip=True).replace("₲", "").replace(".", "").strip()
+    Unchanged pages get their latest snapshot copied forward to today; those
+    without a recent snapshot are scraped anyway.
+
+    Args:
+        loader: Supabase loader
+        pharmacy: Pharmacy source key
+        urls: Product URLs to check
+
+    Returns:
+        Tuple of (URLs that need scraping, fresh validators keyed by URL)
+    """
+    cache = await loader.get_http_cache(pharmacy)
+    semaphore = asyncio.Semaphore(CRAWL_CONCURRENT_REQUESTS)
+    changed, unchanged, validators = [], [], {}
+
+    async def check(client: httpx.AsyncClient, url: str):
+        cached = cache.get(url, {})
+        headers = {}
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+        async with semaphore:
             try:
-                original_price = float(price_text)
-            except:
-                pass
-
-        # Brand
-        brand = None
-        brand_link = soup.select_one("a.category[href*='/marca/']")
-        if brand_link:
-            brand = brand_link.get_text(strip=True)
-
-        product_data = {
-            "pharmacy_source": "punto_farma",
-            "site_code": site_code,
-            "barcode": barcode,
-            "product_name": product_name,
-            "brand": brand,
-            "product_url": url,
-            "current_price": current_price,
-            "original_price": original_price,
-        }
-
-        product_id = await loader.upsert_product(product_data)
-
-        # Insert daily snapshot for tracking campaign
-        if product_id:
-            product_data["id"] = product_id
-            await loader.insert_barcode_snapshot(product_data)
-
-        logger.info(f"✓ {product_name} - ₲{current_price:,.0f}" if current_price else f"✓ {product_name}")
+                response = await client.head(url, headers=headers)
+            except httpx.HTTPError as e:
+                logger.debug(f"HEAD failed for {url}: {e}")
+                changed.append(url)
+                return
+
+        if headers and response.status_code == 304:
+            unchanged.append(url)
+            return
 
-    except Exception as e:
-        logger.error(f"Error scraping {url}: {e}")
+        changed.append(url)
+        etag = response.headers.get("etag")
+        last_modified = response.headers.get("last-modified")
+        if etag or last_modified:
+            validators[url] = {"etag": etag, "last_modified": last_modified}
+
+    async with httpx.AsyncClient(follow_redirects=True, timeout=15) as client:
+        await asyncio.gather(*(check(client, url) for url in urls))
+
+    if unchanged:
+        copied = await loader.copy_latest_snapshots(pharmacy, unchanged)
+        logger.info(f"{pharmacy}: {len(unchanged)} pages unchanged, carried {len(copied)} snapshots forward")
+        # No recent snapshot to copy (or the copy failed): scrape the page after all
+        changed.extend(url for url in unchanged if url not in copied)
+
+    return changed, validators
 
 
 # ============================================================================
-# FARMACIA CENTER HANDLER
+# MAIN SCRAPER
 # ============================================================================
 
-async def scrape_farmacia_center(context: PlaywrightCrawlingContext, loader: SupabaseLoader, product_info: dict):
-    """Scrape Farmacia Center product page."""
-    page = context.page
-    url = context.request.url
+async def open_request_queue(pharmacy: str) -> RequestQueue:
+    """Open a throwaway request queue for one crawler run.
 
-    try:
-        await page.wait_for_load_state("networkidle", timeout=10000)
-        content = await page.content()
-        soup = BeautifulSoup(content, "html.parser")
-
-        # Product name
-        product_name = soup.select_one("div.tit h1")
-        product_name = product_name.get_text(strip=True) if product_name else None
-
-        # Site code and barcode
-        codigo_text = soup.select_one("div.cod_bar")
-        site_code = product_info.get("site_code")
-        barcode = product_info.get("barcode")
-
-        if codigo_text:
-            codigo = codigo_text.get_text(strip=True)
-            if "-" in codigo:
-                parts = codigo.split("-")
-                site_code = parts[0]
-                barcode = parts[1] if len(parts) > 1 else None
-
-        # Brand
-        brand = None
-        brand_elem = soup.select_one("[data-tit]")
-        if brand_elem:
-            tit = brand_elem.get("data-tit", "")
-            if "Medicamentos" in tit or "MEDICAMENTOS" in tit:
-                brand = tit.split()[-1]
+    Pharmacies run concurrently in one process, so each crawler gets its own
+    queue instead of sharing Crawlee's default one.
+    """
+    return await RequestQueue.open(
+        name=f"daily-tracker-{pharmacy.replace('_', '-')}-{uuid.uuid4().hex[:8]}"
+    )
 
-        # Price
-        precio_venta = soup.select_one("span.precio_venta")
-        current_price = None
-        if precio_venta:
-            price_text = precio_venta.get_text(strip=True).replace("₲", "").replace(".", "").strip()
-            try:
-                current_price = float(price_text)
-            except:
-                pass
-
-        # Original price
-        precio_lista = soup.select_one("span.precio_lista")
-        original_price = None
-        if precio_lista:
-            price_text = precio_lista.get_text(strip=True).replace("₲", "").replace(".", "").strip()
-            try:
-                original_price = float(price_text)
-            except:
-                pass
-
-        product_data = {
-            "pharmacy_source": "farma_center",
-            "site_code": site_code,
-            "barcode": barcode,
-            "product_name": product_name,
-            "brand": brand,
-            "product_url": url,
-            "current_price": current_price,
-            "original_price": original_price,
-        }
-
-        product_id = await loader.upsert_product(product_data)
-
-        # Insert daily snapshot for tracking campaign
-        if product_id:
-            product_data["id"] = product_id
-            await loader.insert_barcode_snapshot(product_data)
-
-        logger.info(f"✓ {product_name} - ₲{current_price:,.0f}" if current_price else f"✓ {product_name}")
 
-    except Exception as e:
-        logger.error(f"Error scraping {url}: {e}")
+def build_concurrency_settings(max_concurrency: int, max_tasks_per_minute: int) -> ConcurrencySettings:
+    """Pages mostly wait on the network, so run several at once and let the rate cap throttle.
 
+    Crawlee only starts a request when a concurrency slot is free, so max_concurrency
+    bounds requests in flight (and, for a browser, open pages) before they are sent.
+    """
+    return ConcurrencySettings(
+        min_concurrency=min(2, max_concurrency),
+        desired_concurrency=min(8, max_concurrency),
+        max_concurrency=max_concurrency,
+        max_tasks_per_minute=max_tasks_per_minute,
+    )
 
-# ============================================================================
-# FARMACIA CATEDRAL HANDLER
-# ============================================================================
 
-async def scrape_farmacia_catedral(context: PlaywrightCrawlingContext, loader: SupabaseLoader, product_info: dict):
-    """Scrape Farmacia Catedral product page."""
-    page = context.page
-    url = context.request.url
+class HostRateLimiter:
+    """Space out requests to each pharmacy host to at most its MAX_TASKS_PER_MINUTE cap."""
 
-    try:
-        await page.wait_for_load_state("networkidle", timeout=10000)
-        content = await page.content()
-        soup = BeautifulSoup(content, "html.parser")
-
-        # Try JSON-LD first
-        json_ld = soup.select_one('script[type="application/ld+json"]')
-        product_data = {
-            "pharmacy_source": "farmacia_catedral",
-            "site_code": product_info.get("site_code"),
-            "barcode": product_info.get("barcode"),
-            "product_url": url,
-        }
-
-        if json_ld:
-            try:
-                data = json.loads(json_ld.string)
-                product_data["product_name"] = data.get("name")
-                product_data["barcode"] = data.get("gtin13") or product_info.get("barcode")
-                product_data["site_code"] = data.get("sku") or product_info.get("site_code")
-                product_data["brand"] = data.get("brand", {}).get("name")
-
-                # Price
-                offers = data.get("offers", {})
-                price = offers.get("price")
-                if price:
-                    try:
-                        product_data["current_price"] = float(price)
-                    except:
-                        pass
-            except:
-                pass
-
-        # HTML fallback
-        if not product_data.get("product_name"):
-            name_elem = soup.select_one("h1.product-title")
-            product_data["product_name"] = name_elem.get_text(strip=True) if name_elem else None
-
-        if not product_data.get("current_price"):
-            price_elem = soup.select_one("span.price-final")
-            if price_elem:
-                price_text = price_elem.get_text(strip=True).replace("₲", "").replace(".", "").strip()
-                try:
-                    product_data["current_price"] = float(price_text)
-                except:
-                    pass
-
-        product_id = await loader.upsert_product(product_data)
-
-        # Insert daily snapshot for tracking campaign
-        if product_id:
-            product_data["id"] = product_id
-            await loader.insert_barcode_snapshot(product_data)
-
-        name = product_data.get("product_name")
-        price = product_data.get("current_price")
-        logger.info(f"✓ {name} - ₲{price:,.0f}" if price else f"✓ {name}")
+    def __init__(self):
+        self._next_slot: dict[str, float] = {}
 
-    except Exception as e:
-        logger.error(f"Error scraping {url}: {e}")
+    async def wait(self, pharmacy: str) -> None:
+        """Sleep until the next request slot for pharmacy's host is due, and claim it."""
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot.get(pharmacy, now))
+        self._next_slot[pharmacy] = slot + 60 / MAX_TASKS_PER_MINUTE.get(pharmacy, DEFAULT_MAX_TASKS_PER_MINUTE)
+        if slot > now:
+            await asyncio.sleep(slot - now)
 
 
-# ============================================================================
-# MAIN SCRAPER
-# ============================================================================
+async def scrape_pharmacy(
+    pharmacy: str,
+    urls_list: list,
+    product_lookup: dict,
+    writer: BatchWriter,
+    saved_urls: set,
+) -> list:
+    """
+    Scrape a pharmacy's static product pages over HTTP.
 
-async def scrape_pharmacy(pharmacy: str, urls_list: list, loader: SupabaseLoader):
-    """Scrape products for a specific pharmacy."""
+    Args:
+        product_lookup: Rows from barcode_tracking_urls keyed by URL, for every pharmacy
+        saved_urls: URLs the writer has confirmed upserted; only these get their HTTP validators cached
+
+    Returns:
+        URLs that still need a real browser
+    """
     if not urls_list:
         logger.info(f"No URLs to scrape for {pharmacy}")
-        return
+        return []
 
     logger.info(f"\n{'='*60}")
     logger.info(f"Scraping {pharmacy.upper()} - {len(urls_list)} products")
     logger.info(f"{'='*60}\n")
 
-    # Map pharmacy to handler
-    handlers = {
-        "farma_oliva": scrape_farma_oliva,
-        "punto_farma": scrape_punto_farma,
-        "farma_center": scrape_farmacia_center,
-        "farmacia_catedral": scrape_farmacia_catedral,
-    }
-
-    handler = handlers.get(pharmacy)
-    if not handler:
+    spec = SPECS.get(pharmacy)
+    if not spec:
         logger.error(f"No handler for {pharmacy}")
-        return
+        return []
+
+    urls = [p["url"] for p in urls_list]
+
+    if PHARMACY_URLS[pharmacy].get("requires_browser"):
+        # Prices are rendered by JavaScript, so an unchanged HTML page proves nothing
+        return urls
+
+    # URLs the HTTP crawler could not parse, retried with a real browser
+    browser_urls = []
 
-    # Create product info lookup
-    product_lookup = {p["url"]: p for p in urls_list}
+    validators = {}
 
-    # Define request handler
-    async def request_handler(context: PlaywrightCrawlingContext):
+    async def http_handler(context: BeautifulSoupCrawlingContext):
         url = context.request.url
-        product_info = product_lookup.get(url, {})
-        await handler(context, loader, product_info)
-
-    # Configure crawler - use only 1 browser for GitHub Actions stability
-    concurrency_settings = ConcurrencySettings(
-        max_concurrency=1,  # Single browser for GitHub Actions (prevents crashes)
-        min_concurrency=1,
-        desired_concurrency=1,
+        try:
+            product_data = parse_product(pharmacy, spec, context.soup, url, product_lookup.get(url, {}))
+        except Exception as e:
+            # Handled requests never reach failed_request_handler, so hand it over here
+            logger.error(f"Error scraping {url}, retrying with browser: {e}")
+            browser_urls.append(url)
+            return
+
+        if not product_data.get("product_name") or product_data.get("current_price") is None:
+            # Same fallback as the per-site scrapers: never snapshot a null price from static HTML
+            logger.warning(f"No product name or price in static HTML for {url}, retrying with browser")
+            browser_urls.append(url)
+            return
+        await save_product(writer, product_data)
+
+    if CONDITIONAL_FETCH:
+        urls, validators = await filter_changed_urls(writer.loader, pharmacy, urls)
+
+    # Static pages: plain HTTP + BeautifulSoup, no Chromium needed
+    request_queue = await open_request_queue(pharmacy)
+    crawler = BeautifulSoupCrawler(
+        request_manager=request_queue,
+        parser=HTML_PARSER,
+        # This crawler only talks to one host, so its concurrency is the per-host limit
+        concurrency_settings=build_concurrency_settings(
+            BROWSER_POOL_SIZE, MAX_TASKS_PER_MINUTE.get(pharmacy, DEFAULT_MAX_TASKS_PER_MINUTE)
+        ),
+        request_handler=http_handler,
+        request_handler_timeout=timedelta(seconds=45),
+        max_request_retries=3,
     )
 
+    @crawler.failed_request_handler
+    async def http_failed(context, error):
+        browser_urls.append(context.request.url)
+
+    try:
+        await crawler.run(urls)
+    finally:
+        await request_queue.drop()
+
+    if validators:
+        await writer.flush()
+        await writer.loader.upsert_http_cache(
+            pharmacy, {url: v for url, v in validators.items() if url in saved_urls}
+        )
+
+    logger.info(f"✅ Completed {pharmacy} over HTTP ({len(browser_urls)} left for the browser)")
+    return browser_urls
+
+
+async def scrape_in_browser(
+    browser_urls: dict,
+    product_lookup: dict,
+    writer: BatchWriter,
+):
+    """
+    Render the remaining product pages of every pharmacy in one shared browser pool.
+
+    Each request is labelled with its pharmacy, which selects the selector spec,
+    so a single Chromium serves all hosts. At most MAX_CONCURRENT_PAGES pages
+    are open at once.
+
+    Args:
+        browser_urls: Dict with pharmacy_source as keys, list of URLs as values
+        product_lookup: Rows from barcode_tracking_urls keyed by URL
+        writer: Batch writer for products and snapshots
+    """
+    # Cookies saved after the first good page of each site are loaded into new browser contexts
+    state_path = storage_state_path("daily_tracker")
+    state_saved = set()
+
+    async def browser_handler(context: PlaywrightCrawlingContext):
+        url = context.request.url
+        pharmacy = context.request.label
+        spec = SPECS[pharmacy]
+        try:
+            await context.page.wait_for_load_state("domcontentloaded", timeout=5000)
+            if spec.ready_pattern:
+                await wait_for_text(context.page, spec.ready_sel, spec.ready_pattern, timeout=5000)
+            else:
+                await context.page.wait_for_selector(
+                    spec.ready_sel, state="attached", timeout=5000
+                )
+            if pharmacy not in state_saved:
+                state_saved.add(pharmacy)
+                await save_storage_state(context.page, state_path)
+            soup = make_soup(await context.page.content())
+            product_data = parse_product(pharmacy, spec, soup, url, product_lookup.get(url, {}))
+        except Exception as e:
+            logger.error(f"Error scraping {url}: {e}")
+            return
+
+        await save_product(writer, product_data)
+
+    total = sum(len(urls) for urls in browser_urls.values())
+    logger.info(f"Rendering {total} pages in the browser ({', '.join(browser_urls)})")
+
+    # Crawlee's max_tasks_per_minute is one budget for the whole crawler, which a single
+    # host could use up, so each host's own cap is enforced before its pages navigate
+    rate_limiter = HostRateLimiter()
+
+    request_queue = await open_request_queue("browser")
     crawler = PlaywrightCrawler(
-        concurrency_settings=concurrency_settings,
-        request_handler=request_handler,
+        request_manager=request_queue,
+        # Crawler-wide ceiling only; per-host caps are applied in prepare_page
+        concurrency_settings=build_concurrency_settings(
+            MAX_CONCURRENT_PAGES,
+            sum(MAX_TASKS_PER_MINUTE.get(p, DEFAULT_MAX_TASKS_PER_MINUTE) for p in browser_urls),
+        ),
+        request_handler=browser_handler,
         request_handler_timeout=timedelta(seconds=45),
         max_request_retries=3,
-        headless=True,
-        browser_type="chromium",
-        browser_launch_options={"args": ["--no-sandbox", "--disable-setuid-sandbox"]},
+        browser_pool=build_browser_pool(max_open_pages=MAX_CONCURRENT_PAGES),
     )
 
-    # Add URLs
-    urls = [p["url"] for p in urls_list]
-    await crawler.run(urls)
+    @crawler.pre_navigation_hook
+    async def prepare_page(context: PlaywrightPreNavCrawlingContext):
+        await rate_limiter.wait(context.request.label)
+        await restore_storage_state(context.page, state_path)
+        await block_heavy_resources(context.page, SPECS[context.request.label].blocked_resources)
+
+    try:
+        await crawler.run([
+            Request.from_url(url, label=pharmacy)
+            for pharmacy, urls in browser_urls.items()
+            for url in urls
+        ])
+    finally:
+        await request_queue.drop()
 
-    logger.info(f"✅ Completed {pharmacy}")
+    logger.info("✅ Completed browser pages")
 
 
 async def main():
     """Main entry point for daily tracker."""
-    import os
-
     start_time = datetime.now()
     logger.info(f"\n{'='*60}")
     logger.info(f"DAILY BARCODE TRACKER - {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
@@ -433,32 +585,59 @@ async def main():
 
     loader = SupabaseLoader()
 
+    # Check if filtering by pharmacy (for parallel GitHub Actions jobs)
+    pharmacy_filter = os.getenv("PHARMACY_FILTER")
+    if pharmacy_filter:
+        logger.info(f"Filtering to pharmacy: {pharmacy_filter}")
+
     # Get URLs marked for daily tracking
-    urls_by_pharmacy = await get_daily_tracking_urls(loader)
+    urls_by_pharmacy = await get_daily_tracking_urls(loader, pharmacy_filter)
 
     if not urls_by_pharmacy:
+        if pharmacy_filter:
+            logger.warning(f"No URLs found for {pharmacy_filter}")
+            return
         logger.warning("No URLs in barcode_tracking_urls table!")
         logger.info("Run scripts/populate_tracking_urls.py first to populate URLs")
         return
 
-    # Check if filtering by pharmacy (for parallel GitHub Actions jobs)
-    pharmacy_filter = os.getenv("PHARMACY_FILTER")
-    if pharmacy_filter:
-        logger.info(f"Filtering to pharmacy: {pharmacy_filter}")
-        if pharmacy_filter in urls_by_pharmacy:
-            urls_by_pharmacy = {pharmacy_filter: urls_by_pharmacy[pharmacy_filter]}
-        else:
-            logger.warning(f"No URLs found for {pharmacy_filter}")
-            return
+    product_lookup = {p["url"]: p for urls_list in urls_by_pharmacy.values() for p in urls_list}
+
+    # URLs whose product upsert succeeded, so a failed save is never cached as unchanged
+    saved_urls = set()
 
-    # Scrape each pharmacy
-    for pharmacy, urls_list in urls_by_pharmacy.items():
-        await scrape_pharmacy(pharmacy, urls_list, loader)
+    # All pharmacies share one writer so products are upserted in bulk batches
+    async with BatchWriter(loader, on_saved=lambda product: saved_urls.add(product["product_url"])) as writer:
+        browser_urls = {}
+        pharmacy_semaphore = asyncio.Semaphore(PHARMACY_PARALLELISM or len(urls_by_pharmacy))
+
+        async def run_http_phase(pharmacy: str, urls_list: list):
+            # A failing pharmacy is logged, not allowed to cancel its siblings
+            try:
+                async with pharmacy_semaphore:
+                    remaining = await scrape_pharmacy(pharmacy, urls_list, product_lookup, writer, saved_urls)
+            except Exception as e:
+                logger.error(f"Scraping {pharmacy} failed: {e}")
+                return
+            if remaining:
+                browser_urls[pharmacy] = remaining
+
+        # Static pages first, pharmacies concurrently - each one targets a different host
+        async with asyncio.TaskGroup() as tg:
+            for pharmacy, urls_list in urls_by_pharmacy.items():
+                tg.create_task(run_http_phase(pharmacy, urls_list))
+
+        # Then one shared browser for every page that needs JavaScript
+        if browser_urls:
+            try:
+                await scrape_in_browser(browser_urls, product_lookup, writer)
+            except Exception as e:
+                logger.error(f"Browser scraping failed: {e}")
 
     # Summary
     end_time = datetime.now()
     duration = (end_time - start_time).total_seconds()
-    total_products = sum(len(urls) for urls in urls_by_pharmacy.values())
+    total_products = len(product_lookup)
 
     logger.info(f"\n{'='*60}")
     logger.info(f"COMPLETED")
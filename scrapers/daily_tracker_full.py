@@ -4,10 +4,20 @@ Orchestrates existing scrapers to extract complete product data from tracked URL
 """
 
 import asyncio
+import uuid
 from datetime import datetime, timedelta
-from crawlee import ConcurrencySettings
-from crawlee.crawlers import PlaywrightCrawler, PlaywrightCrawlingContext
-from storage.supabase_loader import SupabaseLoader
+from crawlee import ConcurrencySettings, Request
+from crawlee.crawlers import PlaywrightCrawler, PlaywrightCrawlingContext, PlaywrightPreNavCrawlingContext
+from crawlee.storages import RequestQueue
+from storage.supabase_loader import BatchWriter, SupabaseLoader
+from utils.crawling import (
+    BLOCKED_MEDIA_TYPES,
+    BLOCKED_RESOURCE_TYPES,
+    block_heavy_resources,
+    build_browser_pool,
+    page_fragment,
+    wait_for_text,
+)
 from utils.logger import get_logger
 
 # Import extraction classes from original scrapers
@@ -64,25 +74,21 @@ async def get_daily_tracking_urls(loader: SupabaseLoader) -> dict:
 # HANDLER WRAPPERS (use original extraction logic)
 # ============================================================================
 
-async def scrape_farma_oliva(context: PlaywrightCrawlingContext, loader: SupabaseLoader, product_info: dict):
+async def scrape_farma_oliva(context: PlaywrightCrawlingContext, writer: BatchWriter):
     """Scrape Farma Oliva using original extraction class."""
     page = context.page
     url = context.request.url
 
     try:
-        await page.wait_for_load_state("networkidle", timeout=10000)
-        content = await page.content()
+        await page.wait_for_load_state("domcontentloaded", timeout=5000)
+        await wait_for_text(page, "#producto-precio", pattern=r"\d", timeout=5000)
+        content = await page_fragment(page, FarmaOlivaProduct.FRAGMENT_SELECTORS)
 
         # Use original extraction class
         product_data = FarmaOlivaProduct.extract_from_html(content, url)
 
         if product_data:
-            product_id = await loader.upsert_product(product_data)
-
-            # Insert daily snapshot
-            if product_id:
-                product_data["id"] = product_id
-                await loader.insert_barcode_snapshot(product_data)
+            await writer.add_snapshot(product_data)
 
             name = product_data.get("product_name")
             price = product_data.get("current_price")
@@ -94,25 +100,21 @@ async def scrape_farma_oliva(context: PlaywrightCrawlingContext, loader: Supabas
         logger.error(f"Error scraping {url}: {e}")
 
 
-async def scrape_punto_farma(context: PlaywrightCrawlingContext, loader: SupabaseLoader, product_info: dict):
+async def scrape_punto_farma(context: PlaywrightCrawlingContext, writer: BatchWriter):
     """Scrape Punto Farma using original extraction class."""
     page = context.page
     url = context.request.url
 
     try:
-        await page.wait_for_load_state("networkidle", timeout=10000)
+        await page.wait_for_load_state("domcontentloaded", timeout=5000)
+        await page.wait_for_selector("h1", state="attached", timeout=5000)
         content = await page.content()
 
         # Use original extraction class
         product_data = PuntoFarmaProduct.extract_from_html(content, url)
 
         if product_data:
-            product_id = await loader.upsert_product(product_data)
-
-            # Insert daily snapshot
-            if product_id:
-                product_data["id"] = product_id
-                await loader.insert_barcode_snapshot(product_data)
+            await writer.add_snapshot(product_data)
 
             name = product_data.get("product_name")
             price = product_data.get("current_price")
@@ -124,25 +126,21 @@ async def scrape_punto_farma(context: PlaywrightCrawlingContext, loader: Supabas
         logger.error(f"Error scraping {url}: {e}")
 
 
-async def scrape_farmacia_center(context: PlaywrightCrawlingContext, loader: SupabaseLoader, product_info: dict):
+async def scrape_farmacia_center(context: PlaywrightCrawlingContext, writer: BatchWriter):
     """Scrape Farmacia Center using original extraction class."""
     page = context.page
     url = context.request.url
 
     try:
-        await page.wait_for_load_state("networkidle", timeout=10000)
+        await page.wait_for_load_state("domcontentloaded", timeout=5000)
+        await page.wait_for_selector("h1.tit", state="attached", timeout=5000)
         content = await page.content()
 
         # Use original extraction class
         product_data = FarmaciaCenterProduct.extract_from_html(content, url)
 
         if product_data:
-            product_id = await loader.upsert_product(product_data)
-
-            # Insert daily snapshot
-            if product_id:
-                product_data["id"] = product_id
-                await loader.insert_barcode_snapshot(product_data)
+            await writer.add_snapshot(product_data)
 
             name = product_data.get("product_name")
             price = product_data.get("current_price")
@@ -154,25 +152,21 @@ async def scrape_farmacia_center(context: PlaywrightCrawlingContext, loader: Sup
         logger.error(f"Error scraping {url}: {e}")
 
 
-async def scrape_farmacia_catedral(context: PlaywrightCrawlingContext, loader: SupabaseLoader, product_info: dict):
+async def scrape_farmacia_catedral(context: PlaywrightCrawlingContext, writer: BatchWriter):
     """Scrape Farmacia Catedral using original extraction class."""
     page = context.page
     url = context.request.url
 
     try:
-        await page.wait_for_load_state("networkidle", timeout=10000)
+        await page.wait_for_load_state("domcontentloaded", timeout=5000)
+        await page.wait_for_selector("h1.title-ficha", state="attached", timeout=5000)
         content = await page.content()
 
         # Use original extraction class
         product_data = FarmaciaCatedralProduct.extract_from_html(content, url)
 
         if product_data:
-            product_id = await loader.upsert_product(product_data)
-
-            # Insert daily snapshot
-            if product_id:
-                product_data["id"] = product_id
-                await loader.insert_barcode_snapshot(product_data)
+            await writer.add_snapshot(product_data)
 
             name = product_data.get("product_name")
             price = product_data.get("current_price")
@@ -188,60 +182,78 @@ async def scrape_farmacia_catedral(context: PlaywrightCrawlingContext, loader: S
 # MAIN SCRAPER
 # ============================================================================
 
-async def scrape_pharmacy(pharmacy: str, urls_list: list, loader: SupabaseLoader):
-    """Scrape products for a specific pharmacy using original extraction logic."""
-    if not urls_list:
-        logger.info(f"No URLs to scrape for {pharmacy}")
-        return
+# Map pharmacy to handler
+HANDLERS = {
+    "farma_oliva": scrape_farma_oliva,
+    "punto_farma": scrape_punto_farma,
+    "farma_center": scrape_farmacia_center,
+    "farmacia_catedral": scrape_farmacia_catedral,
+}
 
-    logger.info(f"\n{'='*60}")
-    logger.info(f"Scraping {pharmacy.upper()} - {len(urls_list)} products")
-    logger.info(f"{'='*60}\n")
 
-    # Map pharmacy to handler
-    handlers = {
-        "farma_oliva": scrape_farma_oliva,
-        "punto_farma": scrape_punto_farma,
-        "farma_center": scrape_farmacia_center,
-        "farmacia_catedral": scrape_farmacia_catedral,
-    }
-
-    handler = handlers.get(pharmacy)
-    if not handler:
-        logger.error(f"No handler for {pharmacy}")
+async def scrape_pharmacies(urls_by_pharmacy: dict, loader: SupabaseLoader):
+    """
+    Scrape every pharmacy's products in one shared crawler and browser pool.
+
+    Requests are labelled with their pharmacy, which selects the extraction
+    handler, so Chromium is launched once for the whole run.
+    """
+    requests = []
+    for pharmacy, urls_list in urls_by_pharmacy.items():
+        if not urls_list:
+            logger.info(f"No URLs to scrape for {pharmacy}")
+            continue
+        if pharmacy not in HANDLERS:
+            logger.error(f"No handler for {pharmacy}")
+            continue
+
+        logger.info(f"Queued {pharmacy.upper()} - {len(urls_list)} products")
+        requests.extend(Request.from_url(p["url"], label=pharmacy) for p in urls_list)
+
+    if not requests:
         return
 
-    # Create product info lookup
-    product_lookup = {p["url"]: p for p in urls_list}
+    # Batched upserts; each snapshot is written only once its upsert returned the product ID
+    writer = BatchWriter(loader)
 
     # Define request handler
     async def request_handler(context: PlaywrightCrawlingContext):
-        url = context.request.url
-        product_info = product_lookup.get(url, {})
-        await handler(context, loader, product_info)
+        await HANDLERS[context.request.label](context, writer)
 
-    # Configure crawler - moderate concurrency for stability
+    # Configure crawler - moderate concurrency per pharmacy for stability
+    pharmacy_count = len({request.label for request in requests})
     concurrency_settings = ConcurrencySettings(
-        max_concurrency=10,
+        max_concurrency=10 * pharmacy_count,
         min_concurrency=1,
-        desired_concurrency=10,
+        desired_concurrency=10 * pharmacy_count,
     )
 
+    # Throwaway request queue so runs never resume a stale default queue
+    request_queue = await RequestQueue.open(name=f"daily-tracker-full-{uuid.uuid4().hex[:8]}")
+
     crawler = PlaywrightCrawler(
+        request_manager=request_queue,
         concurrency_settings=concurrency_settings,
         request_handler=request_handler,
         request_handler_timeout=timedelta(seconds=45),
         max_request_retries=3,
-        headless=True,
-        browser_type="chromium",
-        browser_launch_options={"args": ["--no-sandbox", "--disable-setuid-sandbox"]},
+        # No persistent profile: it would pin every pharmacy's pages to one never-recycled browser
+        browser_pool=build_browser_pool(),
     )
 
-    # Add URLs
-    urls = [p["url"] for p in urls_list]
-    await crawler.run(urls)
+    @crawler.pre_navigation_hook
+    async def block_resources(context: PlaywrightPreNavCrawlingContext):
+        # Farma Oliva's price script may rely on its stylesheets; image URLs are read from <img src>
+        resource_types = BLOCKED_MEDIA_TYPES if context.request.label == "farma_oliva" else BLOCKED_RESOURCE_TYPES
+        await block_heavy_resources(context.page, resource_types)
 
-    logger.info(f"✅ Completed {pharmacy}")
+    try:
+        async with writer:
+            await crawler.run(requests)
+    finally:
+        await request_queue.drop()
+
+    logger.info(f"✅ Completed {', '.join(urls_by_pharmacy)}")
 
 
 async def main():
@@ -273,9 +285,11 @@ async def main():
             logger.warning(f"No URLs found for {pharmacy_filter}")
             return
 
-    # Scrape each pharmacy
-    for pharmacy, urls_list in urls_by_pharmacy.items():
-        await scrape_pharmacy(pharmacy, urls_list, loader)
+    # Scrape all pharmacies in one crawler - Crawlee interleaves the hosts
+    try:
+        await scrape_pharmacies(urls_by_pharmacy, loader)
+    except Exception as e:
+        logger.error(f"Scraping failed: {e}")
 
     # Summary
     end_time = datetime.now()
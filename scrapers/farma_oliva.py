@@ -1,16 +1,27 @@
 """Farma Oliva scraper for pharmaceutical products."""
 
 import asyncio
+import os
 import re
 from typing import Any, Dict, List, Optional
-from crawlee import Request
-from crawlee.crawlers import PlaywrightCrawler, PlaywrightCrawlingContext
+from crawlee import ConcurrencySettings, Request
+from crawlee.crawlers import PlaywrightCrawler, PlaywrightCrawlingContext, PlaywrightPreNavCrawlingContext
 from crawlee.proxy_configuration import ProxyConfiguration
 from crawlee.router import Router
-from bs4 import BeautifulSoup
 from utils.config import get_settings, PHARMACY_URLS
+from utils.crawling import (
+    BLOCKED_MEDIA_TYPES,
+    PAGE_TIMEOUT_MS,
+    block_heavy_resources,
+    browser_profile_dir,
+    build_browser_pool,
+    page_fragment,
+    wait_for_text,
+)
 from utils.logger import setup_logger, get_logger
-from storage.supabase_loader import SupabaseLoader
+from utils.parsing import css, has_any, intern_text, make_soup, parse_guarani
+from storage.digest_cache import DigestCache
+from storage.supabase_loader import BatchWriter, SupabaseLoader
 
 # Setup logger
 setup_logger()
@@ -22,27 +33,60 @@ router = Router()
 # Global db_loader instance (will be set in main())
 db_loader_instance = None
 
+# Buffers product upserts into bulk writes (set in main())
+batch_writer_instance = None
+
+# Digests of products as last saved, to skip unchanged upserts on re-crawls
+digest_cache_instance = DigestCache("farma_oliva")
+
+# URLs already enqueued this crawl (cleared when main() starts one); category
+# pages cross-link the same products
+_seen_urls: set = set()
+
+# Upper bound on pages open at once; listing and product pages share the pool
+CRAWL_CONCURRENT_REQUESTS = int(os.getenv("CRAWL_CONCURRENT_REQUESTS", "30"))
+
+# Compiled once at import instead of looked up in re's cache on every page
+_PERCENT_RE = re.compile(r"(\d+)%")
+
 
 class FarmaOlivaProduct:
     """Data class for Farma Oliva product extraction."""
 
+    # Page regions extract_from_html reads; see utils.crawling.page_fragment
+    FRAGMENT_SELECTORS = (
+        ".single-product-header",
+        "#producto-codigo",
+        "#producto-ean",
+        ".ecommercepro-breadcrumb",
+        ".badge-pill",
+        "#producto-precio",
+        "#producto-precio-anterior",
+        ".discount",
+        "a.logo-marca",
+        "button[data-product_brand]",
+        ".ecommercepro-product-details__short-description",
+        "#tab-1",
+        ".ecommercepro-product-gallery__image",
+    )
+
     @staticmethod
     def extract_from_html(html: str, url: str) -> Optional[Dict[str, Any]]:
         """
         Extract product data from Farma Oliva product page HTML.
 
         Args:
-            html: HTML content of product page
+            html: HTML content of product page, or the FRAGMENT_SELECTORS regions of it
             url: Product URL
 
         Returns:
             Dictionary with product data, or None if extraction fails
         """
         try:
-            soup = BeautifulSoup(html, "html.parser")
+            soup = make_soup(html)
 
             # Product name
-            product_name_elem = soup.select_one(".single-product-header h1.product_title")
+            product_name_elem = css(".single-product-header h1.product_title").select_one(soup)
             product_name = product_name_elem.get_text(strip=True) if product_name_elem else None
 
             if not product_name:
@@ -52,8 +96,8 @@ class FarmaOlivaProduct:
             # Site code and barcode
             site_code = None
             barcode = None
-            code_elem = soup.select_one("#producto-codigo")
-            barcode_elem = soup.select_one("#producto-ean")
+            code_elem = css("#producto-codigo").select_one(soup)
+            barcode_elem = css("#producto-ean").select_one(soup)
 
             if code_elem:
                 site_code = code_elem.get_text(strip=True)
@@ -63,11 +107,11 @@ class FarmaOlivaProduct:
             # Category path from breadcrumb
             category_path = []
             main_category = None
-            breadcrumb = soup.select(".ecommercepro-breadcrumb a")
+            breadcrumb = css(".ecommercepro-breadcrumb a").select(soup)
             for link in breadcrumb:
                 category_text = link.get_text(strip=True)
                 if category_text and category_text not in ["Inicio", "Catálogo de productos"]:
-                    category_path.append(category_text)
+                    category_path.append(intern_text(category_text))
 
             if category_path:
                 main_category = category_path[0]
@@ -75,11 +119,11 @@ class FarmaOlivaProduct:
             # Prescription requirement
             requires_prescription = False
             prescription_type = None
-            prescription_badge = soup.select_one(".badge-pill")
+            prescription_badge = css(".badge-pill").select_one(soup)
             if prescription_badge:
                 prescription_text = prescription_badge.get_text(strip=True)
                 prescription_type = prescription_text
-                requires_prescription = "libre" not in prescription_text.lower()
+                requires_prescription = not has_any(prescription_text, "libre")
 
             # Price (remove currency symbols and parse)
             current_price = None
@@ -87,27 +131,21 @@ class FarmaOlivaProduct:
             discount_percentage = None
             discount_amount = None
 
-            price_elem = soup.select_one("#producto-precio")
+            price_elem = css("#producto-precio").select_one(soup)
             if price_elem:
-                price_text = price_elem.get_text(strip=True)
-                # Extract numeric price (e.g., "₲. 59.400 *" -> "59400")
-                price_match = re.search(r"[\d.]+", price_text.replace(".", ""))
-                if price_match:
-                    current_price = float(price_match.group())
+                # Integer guaraníes (e.g., "₲. 59.400 *" -> 59400)
+                current_price = parse_guarani(price_elem.get_text(strip=True))
 
             # Original price (if discounted)
-            original_price_elem = soup.select_one("#producto-precio-anterior")
+            original_price_elem = css("#producto-precio-anterior").select_one(soup)
             if original_price_elem:
-                price_text = original_price_elem.get_text(strip=True)
-                price_match = re.search(r"[\d.]+", price_text.replace(".", ""))
-                if price_match:
-                    original_price = float(price_match.group())
+                original_price = parse_guarani(original_price_elem.get_text(strip=True))
 
             # Discount percentage (from badge)
-            discount_badge = soup.select_one(".discount text")
+            discount_badge = css(".discount text").select_one(soup)
             if discount_badge:
                 discount_text = discount_badge.get_text(strip=True)
-                discount_match = re.search(r"(\d+)%", discount_text)
+                discount_match = _PERCENT_RE.search(discount_text)
                 if discount_match:
                     discount_percentage = float(discount_match.group(1))
 
@@ -120,19 +158,20 @@ class FarmaOlivaProduct:
 
             # Brand (from logo-marca link)
             brand = None
-            brand_elem = soup.select_one("a.logo-marca")
+            brand_elem = css("a.logo-marca").select_one(soup)
             if brand_elem:
                 brand = brand_elem.get_text(strip=True)
 
             # If brand not found, try data-product_brand on the buy button
             if not brand:
-                buy_button = soup.select_one("button[data-product_brand]")
+                buy_button = css("button[data-product_brand]").select_one(soup)
                 if buy_button:
                     brand = buy_button.get("data-product_brand")
+            brand = intern_text(brand)
 
             # Product details (Presentación, Droga, etc.)
             product_details = {}
-            short_desc = soup.select_one(".ecommercepro-product-details__short-description")
+            short_desc = css(".ecommercepro-product-details__short-description").select_one(soup)
             if short_desc:
                 # Extract key-value pairs
                 headers = short_desc.find_all("h6")
@@ -145,13 +184,13 @@ class FarmaOlivaProduct:
 
             # Product description (from tab)
             product_description = None
-            desc_tab = soup.select_one("#tab-1")
+            desc_tab = css("#tab-1").select_one(soup)
             if desc_tab:
                 product_description = desc_tab.get_text(separator=" ", strip=True)
 
             # Image URL
             image_url = None
-            image_elem = soup.select_one(".ecommercepro-product-gallery__image img")
+            image_elem = css(".ecommercepro-product-gallery__image img").select_one(soup)
             if image_elem:
                 image_url = image_elem.get("src") or image_elem.get("data-src")
 
@@ -190,20 +229,27 @@ class FarmaOlivaProduct:
             return None
 
 
+def _new_url(href: str) -> Optional[str]:
+    """Return href as an absolute URL and mark it seen, or None if this crawl already enqueued it."""
+    if not href.startswith("http"):
+        href = f"{PHARMACY_URLS['farma_oliva']['base_url']}/{href.lstrip('/')}"
+    if href in _seen_urls:
+        return None
+    _seen_urls.add(href)
+    return href
+
+
 @router.default_handler
 async def handle_product_page(context: PlaywrightCrawlingContext) -> None:
     """Handle product detail pages."""
     logger.info(f"Processing product page: {context.request.url}")
 
     try:
-        # Wait for price element to be populated by JavaScript
-        await context.page.wait_for_selector("#producto-precio", timeout=5000)
+        # Wait for the price to be populated by JavaScript (discounts are filled in the same pass)
+        await wait_for_text(context.page, "#producto-precio", pattern=r"\d", timeout=5000)
 
-        # Wait a bit more for any discount JavaScript to execute
-        await context.page.wait_for_timeout(1000)
-
-        # Get page HTML after JavaScript execution
-        html = await context.page.content()
+        # Only the regions the extractor reads, not the whole serialized DOM
+        html = await page_fragment(context.page, FarmaOlivaProduct.FRAGMENT_SELECTORS)
 
         # Extract product data
         product_data = FarmaOlivaProduct.extract_from_html(html, context.request.url)
@@ -213,13 +259,17 @@ async def handle_product_page(context: PlaywrightCrawlingContext) -> None:
             await context.push_data(product_data)
 
             # Save to Supabase immediately
-            global db_loader_instance
-            if db_loader_instance:
-                product_id = await db_loader_instance.upsert_product(product_data)
-                if product_id:
-                    logger.info(f"Saved to Supabase: {product_data['product_name']}")
-                else:
-                    logger.warning(f"Failed to save to Supabase: {product_data['product_name']}")
+            global batch_writer_instance
+            if batch_writer_instance:
+                digest = digest_cache_instance.digest(product_data)
+                if digest_cache_instance.is_unchanged(context.request.url, digest):
+                    digest_cache_instance.mark_unchanged(product_data["site_code"])
+                    logger.info(f"Unchanged, skipping upsert: {product_data['product_name']}")
+                    return
+
+                # Written in bulk; the digest is recorded once the batch is saved
+                await batch_writer_instance.add_product(product_data)
+                logger.info(f"Queued for Supabase: {product_data['product_name']}")
             else:
                 logger.info(f"Saved to local dataset: {product_data['product_name']}")
         else:
@@ -238,22 +288,20 @@ async def handle_category_listing(context: PlaywrightCrawlingContext) -> None:
         # Wait for product grid to load
         await context.page.wait_for_selector(".products", timeout=10000)
 
-        # Extract all product links
-        product_links = await context.page.locator(".product a.ecommercepro-LoopProduct-link").all()
+        # Extract all product hrefs in one round trip instead of one per link
+        hrefs = await context.page.locator(".product a.ecommercepro-LoopProduct-link").evaluate_all(
+            "links => links.map((a) => a.getAttribute('href'))"
+        )
 
-        logger.info(f"Found {len(product_links)} products on page")
+        logger.info(f"Found {len(hrefs)} products on page")
 
-        # Enqueue each product link
-        for link in product_links:
-            href = await link.get_attribute("href")
-            if href:
-                # Convert relative URLs to absolute
-                if not href.startswith("http"):
-                    base_url = PHARMACY_URLS["farma_oliva"]["base_url"]
-                    href = f"{base_url}/{href.lstrip('/')}"
+        # Enqueue new product links in a single batch
+        new_urls = [url for url in (_new_url(href) for href in hrefs if href) if url]
+        new_requests = [Request.from_url(url, label="default") for url in new_urls]
 
-                await context.add_requests([Request.from_url(href, label="default")])
-                logger.debug(f"Enqueued product: {href}")
+        if new_requests:
+            await context.add_requests(new_requests)
+            logger.debug(f"Enqueued {len(new_requests)} new products")
 
         # Check for pagination/next page
         next_button = context.page.locator("a.next.page-numbers").first
@@ -265,13 +313,13 @@ async def handle_category_listing(context: PlaywrightCrawlingContext) -> None:
             logger.info(f"Next button href (raw): {next_href}")
 
             if next_href:
-                if not next_href.startswith("http"):
-                    base_url = PHARMACY_URLS["farma_oliva"]["base_url"]
-                    next_href = f"{base_url}/{next_href.lstrip('/')}"
-
-                logger.info(f"Enqueuing next page: {next_href}")
-                await context.add_requests([Request.from_url(next_href, label="category_listing")])
-                logger.info(f"✓ Successfully enqueued next page: {next_href}")
+                next_url = _new_url(next_href)
+                if next_url is None:
+                    logger.info(f"Next page already enqueued: {next_href}")
+                else:
+                    logger.info(f"Enqueuing next page: {next_url}")
+                    await context.add_requests([Request.from_url(next_url, label="category_listing")])
+                    logger.info(f"✓ Successfully enqueued next page: {next_url}")
             else:
                 logger.warning(f"Next button found but href is empty")
         else:
@@ -283,10 +331,11 @@ async def handle_category_listing(context: PlaywrightCrawlingContext) -> None:
 
 async def main() -> None:
     """Run Farma Oliva scraper."""
-    global db_loader_instance
+    global db_loader_instance, batch_writer_instance
 
     settings = get_settings()
     base_url = PHARMACY_URLS["farma_oliva"]["base_url"]
+    _seen_urls.clear()  # A new crawl in the same process enqueues everything afresh
 
     # Initialize Supabase loader
     db_loader = SupabaseLoader()
@@ -315,10 +364,26 @@ async def main() -> None:
             proxy_configuration=proxy_configuration,
             max_requests_per_crawl=settings.max_requests_per_crawl,
             max_request_retries=2,  # Limit retries to avoid getting stuck
-            headless=True,
-            browser_launch_options={"args": ["--no-sandbox", "--disable-setuid-sandbox"]},
+            # Start high so the autoscaler doesn't sit at a low concurrency on network-bound pages
+            concurrency_settings=ConcurrencySettings(
+                min_concurrency=min(4, CRAWL_CONCURRENT_REQUESTS),
+                desired_concurrency=min(20, CRAWL_CONCURRENT_REQUESTS),
+                max_concurrency=CRAWL_CONCURRENT_REQUESTS,
+                max_tasks_per_minute=1200,
+            ),
+            # Persistent profile keeps Oliva's JS/CSS cached across product pages and runs
+            browser_pool=build_browser_pool(
+                max_open_pages=CRAWL_CONCURRENT_REQUESTS,
+                user_data_dir=browser_profile_dir("farma_oliva"),
+            ),
         )
 
+        @crawler.pre_navigation_hook
+        async def block_resources(context: PlaywrightPreNavCrawlingContext) -> None:
+            context.page.set_default_timeout(PAGE_TIMEOUT_MS)
+            # Keep stylesheets: the price script may depend on them
+            await block_heavy_resources(context.page, BLOCKED_MEDIA_TYPES)
+
         # Start URLs (category pages)
         start_urls = [
             f"{base_url}/catalogo/medicamentos-c3",  # 3896 products
@@ -327,10 +392,15 @@ async def main() -> None:
 
         logger.info(f"Starting Farma Oliva scraper with URLs: {start_urls}")
 
-        # Enqueue start URLs as category listings
-        await crawler.run([
-            Request.from_url(url, label="category_listing") for url in start_urls
-        ])
+        # Enqueue start URLs as category listings; leaving the writer flushes the last batch
+        async with BatchWriter(db_loader, on_saved=digest_cache_instance.mark_product_saved) as writer:
+            batch_writer_instance = writer
+            try:
+                await crawler.run([
+                    Request.from_url(url, label="category_listing") for url in start_urls
+                ])
+            finally:
+                batch_writer_instance = None
 
         # Get final count from Crawlee storage (products already saved to Supabase during scraping)
         dataset = await crawler.get_dataset()
@@ -339,6 +409,10 @@ async def main() -> None:
         total_scraped = len(data.items)
         logger.info(f"Scraping completed: {total_scraped} products scraped and saved to Supabase")
 
+        # Unchanged products skipped their upsert; refresh scraped_at in bulk instead
+        await db_loader.touch_products("farma_oliva", digest_cache_instance.unchanged_site_codes)
+        digest_cache_instance.save()
+
         # Complete scraping run (products were already saved during crawling)
         await db_loader.complete_scraping_run(run_id, total_scraped, 0)
 
@@ -2,22 +2,32 @@
 
 Phase 1: Scroll and save all product URLs to database
 Phase 2: Scrape each URL from database
+Pipeline: Both at once, scraping each URL as soon as Phase 1 finds it
 """
 
 import asyncio
-import json
 import re
 import sys
 from datetime import timedelta
 from typing import Any, Dict, List, Optional
 from crawlee import Request, ConcurrencySettings
-from crawlee.crawlers import PlaywrightCrawler, PlaywrightCrawlingContext
+from crawlee.crawlers import (
+    BeautifulSoupCrawler,
+    BeautifulSoupCrawlingContext,
+    PlaywrightCrawler,
+    PlaywrightCrawlingContext,
+    PlaywrightPreNavCrawlingContext,
+)
 from crawlee.proxy_configuration import ProxyConfiguration
 from crawlee.router import Router
-from bs4 import BeautifulSoup
+from crawlee.storages import RequestQueue
+from bs4 import BeautifulSoup, SoupStrainer
 from utils.config import get_settings, PHARMACY_URLS
+from utils.crawling import PAGE_TIMEOUT_MS, block_heavy_resources, build_browser_pool
 from utils.logger import setup_logger, get_logger
-from storage.supabase_loader import SupabaseLoader
+from utils.parsing import HTML_PARSER, css, has_any, intern_text, json_loads, make_soup, parse_guarani
+from storage.digest_cache import DigestCache
+from storage.supabase_loader import BatchWriter, SupabaseLoader
 
 # Setup logger
 setup_logger()
@@ -26,9 +36,60 @@ logger = get_logger()
 # Create router for handling different page types
 router = Router()
 
+# Product pages are server-rendered, so phase 2 fetches them over plain HTTP first
+http_router = Router[BeautifulSoupCrawlingContext]()
+
+# Product URLs the HTTP pass could not extract, retried in a real browser
+browser_fallback_urls: List[str] = []
+
 # Global db_loader instance (will be set in main())
 db_loader_instance = None
 
+# Buffers product upserts into bulk writes (set in main() for Phase 2)
+batch_writer_instance = None
+
+# Digests of products as last saved, to skip unchanged upserts on re-crawls
+digest_cache_instance = DigestCache("farmacia_catedral")
+
+# Compiled once at import instead of looked up in re's cache on every page
+_GS_RE = re.compile(r"Gs\.\s*([\d.,]+)")
+_PERCENT_RE = re.compile(r"(\d+)%")
+_DESC_DEL_PROD_RE = re.compile(r"^Descripción del producto\s*", re.IGNORECASE)
+_RESUMEN_RE = re.compile(r"^Resumen del producto\s*", re.IGNORECASE)
+_URL_CODE_RE = re.compile(r"/producto/(\d+)/")
+
+# Phase 1 writes collected URLs in bulk upserts of this many rows
+URL_BATCH_SIZE = 1000
+# Phase 1 API pages fetched at once per category
+API_CONCURRENCY = 4
+# Phase 2 browser fallback: pages open at once across the shared browser pool
+BROWSER_CONCURRENCY = 10
+# "pipeline" phase: product pages fetched at once while Phase 1 is still collecting URLs
+PIPELINE_WORKERS = 20
+# Collected URLs waiting for a pipeline worker; Phase 1 pauses while the queue is full
+PIPELINE_QUEUE_SIZE = 500
+
+# Containers of every element the extractor reads, plus <script> for JSON-LD;
+# skips <head> styles/meta/links and other top-level markup while parsing
+_PRODUCT_STRAINER = SoupStrainer(
+    ["script", "main", "section", "nav", "div", "ol", "ul", "h1", "h3", "p", "a", "img"]
+)
+
+
+def _strip_label(text: str, label: str) -> Optional[str]:
+    """
+    Return what follows a label and optional colon, e.g. "CÓD.: 66" -> "66".
+
+    The label may appear anywhere in text ("Ref. CÓD.: 66" -> "66").
+
+    Returns:
+        The stripped value, or None if text has no label or no value after it
+    """
+    _, found, value = text.partition(label)
+    if not found:
+        return None
+    return value.strip().lstrip(":").strip() or None
+
 
 class FarmaciaCatedralProduct:
     """Data class for Farmacia Catedral product extraction."""
@@ -45,24 +106,42 @@ class FarmaciaCatedralProduct:
         Returns:
             Dictionary with product data, or None if extraction fails
         """
-        try:
-            soup = BeautifulSoup(html, "html.parser")
+        soup = make_soup(html, parse_only=_PRODUCT_STRAINER)
+        return FarmaciaCatedralProduct.extract_from_soup(soup, url)
+
+    @staticmethod
+    def extract_from_soup(soup: BeautifulSoup, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Extract product data from an already parsed Farmacia Catedral product page.
 
+        Args:
+            soup: Parsed product page
+            url: Product URL
+
+        Returns:
+            Dictionary with product data, or None if extraction fails
+        """
+        try:
             # Extract JSON-LD structured data
             json_ld = None
             json_ld_script = soup.find("script", type="application/ld+json")
             if json_ld_script and json_ld_script.string:
                 try:
-                    json_ld = json.loads(json_ld_script.string)
-                except json.JSONDecodeError as e:
+                    json_ld = json_loads(json_ld_script.string)
+                except ValueError as e:
                     logger.warning(f"Failed to parse JSON-LD for {url}: {e}")
 
+            # Every JSON-LD field the extractor reads, looked up once
+            if not isinstance(json_ld, dict):
+                json_ld = {}
+            ld_brand = json_ld.get("brand")
+            ld_offers = json_ld.get("offers")
+            ld_images = json_ld.get("image")
+
             # Product name (from JSON-LD or fallback to h1)
-            product_name = None
-            if json_ld:
-                product_name = json_ld.get("name")
+            product_name = json_ld.get("name")
             if not product_name:
-                product_name_elem = soup.select_one("h1.title-ficha")
+                product_name_elem = css("h1.title-ficha").select_one(soup)
                 product_name = product_name_elem.get_text(strip=True) if product_name_elem else None
 
             if not product_name:
@@ -70,76 +149,59 @@ class FarmaciaCatedralProduct:
                 return None
 
             # Site code (SKU) and barcode
-            site_code = None
+            site_code = json_ld.get("sku")
             barcode = None
 
-            # From JSON-LD
-            if json_ld:
-                site_code = json_ld.get("sku")
-
             # From HTML: <p class="codigo-ficha">CÓD.: 66</p>
             if not site_code:
-                codigo_elem = soup.select_one(".codigo-ficha")
+                codigo_elem = css(".codigo-ficha").select_one(soup)
                 if codigo_elem:
                     codigo_text = codigo_elem.get_text(strip=True)
-                    match = re.search(r"CÓD\.:?\s*(.+)", codigo_text)
-                    if match:
-                        site_code = match.group(1).strip()
+                    site_code = _strip_label(codigo_text, "CÓD.")
 
             # Barcode: <p class="barra-ficha">CÓD. BARRAS: 7840036005616</p>
-            barcode_elem = soup.select_one(".barra-ficha")
+            barcode_elem = css(".barra-ficha").select_one(soup)
             if barcode_elem:
                 barcode_text = barcode_elem.get_text(strip=True)
-                match = re.search(r"CÓD\.\s*BARRAS:?\s*(.+)", barcode_text)
-                if match:
-                    barcode = match.group(1).strip()
+                barcode = _strip_label(_strip_label(barcode_text, "CÓD.") or "", "BARRAS")
 
             # Brand (from JSON-LD or HTML link)
-            brand = None
-            if json_ld and "brand" in json_ld:
-                brand = json_ld["brand"].get("name")
+            brand = ld_brand.get("name") if isinstance(ld_brand, dict) else None
             if not brand:
-                brand_elem = soup.select_one("a.title-marca")
+                brand_elem = css("a.title-marca").select_one(soup)
                 brand = brand_elem.get_text(strip=True) if brand_elem else None
+            brand = intern_text(brand)
 
             # Category from breadcrumb
             category_path = []
             main_category = None
-            breadcrumb_items = soup.select("ol.breadcrumb a.breadcrumb-item")
+            breadcrumb_items = css("ol.breadcrumb a.breadcrumb-item").select(soup)
             for item in breadcrumb_items:
                 category_text = item.get_text(strip=True)
                 if category_text and category_text != "Inicio":
-                    category_path.append(category_text)
+                    category_path.append(intern_text(category_text))
 
             if category_path:
                 main_category = category_path[0]
 
-            # Description (from JSON-LD or HTML)
+            # Description: full tab, else short tab, else JSON-LD
             product_description = None
-            if json_ld:
-                product_description = json_ld.get("description")
 
             # Full description from tab: <div id="home-tab-pane">
-            full_description = None
-            desc_tab = soup.select_one("#home-tab-pane")
+            desc_tab = css("#home-tab-pane").select_one(soup)
             if desc_tab:
-                full_description = desc_tab.get_text(strip=True)
                 # Remove "Descripción del producto" heading (case insensitive)
-                full_description = re.sub(r"^Descripción del producto\s*", "", full_description, flags=re.IGNORECASE)
+                product_description = _DESC_DEL_PROD_RE.sub("", desc_tab.get_text(strip=True))
 
             # Short description from tab: <div id="profile-tab-pane">
-            short_description = None
-            short_desc_tab = soup.select_one("#profile-tab-pane")
-            if short_desc_tab:
-                short_description = short_desc_tab.get_text(strip=True)
-                # Remove "Resumen del producto" heading
-                short_description = re.sub(r"^Resumen del producto\s*", "", short_description, flags=re.IGNORECASE)
-
-            # Prefer full description, fallback to short, then JSON-LD
-            if full_description:
-                product_description = full_description
-            elif short_description:
-                product_description = short_description
+            if not product_description:
+                short_desc_tab = css("#profile-tab-pane").select_one(soup)
+                if short_desc_tab:
+                    # Remove "Resumen del producto" heading
+                    product_description = _RESUMEN_RE.sub("", short_desc_tab.get_text(strip=True))
+
+            if not product_description:
+                product_description = json_ld.get("description")
 
             # Prices
             current_price = None
@@ -147,29 +209,32 @@ class FarmaciaCatedralProduct:
             discount_percentage = None
             discount_amount = None
 
-            # From JSON-LD
-            if json_ld and "offers" in json_ld:
-                offers = json_ld["offers"]
-                if "price" in offers:
-                    current_price = float(offers["price"])
-
             # From HTML: <p class="precio-web">Gs. 74.950 <span>Gs. 149.900</span></p>
-            precio_web = soup.select_one(".precio-web")
+            # Only the markup carries the original (pre-discount) price, so it takes precedence
+            precio_web = css(".precio-web").select_one(soup)
             if precio_web:
                 # Current price (first text node)
                 precio_text = precio_web.get_text(strip=True)
                 # Split to get current and original prices
-                prices = re.findall(r"Gs\.\s*([\d.,]+)", precio_text)
+                prices = _GS_RE.findall(precio_text)
                 if len(prices) >= 1:
-                    current_price = float(prices[0].replace(".", "").replace(",", ""))
+                    current_price = parse_guarani(prices[0])
                 if len(prices) >= 2:
-                    original_price = float(prices[1].replace(".", "").replace(",", ""))
+                    original_price = parse_guarani(prices[1])
+
+            # From JSON-LD, only when the markup had no price
+            if current_price is None and isinstance(ld_offers, dict) and "price" in ld_offers:
+                # schema.org prices use "." as the decimal separator, so not parse_guarani
+                try:
+                    current_price = int(float(ld_offers["price"]))
+                except (TypeError, ValueError):
+                    logger.warning(f"Unparseable JSON-LD price for {url}: {ld_offers['price']!r}")
 
             # Discount percentage from tag: <p class="tag-descuentos">-50%</p>
-            discount_tag = soup.select_one(".tag-descuentos")
+            discount_tag = css(".tag-descuentos").select_one(soup)
             if discount_tag:
                 discount_text = discount_tag.get_text(strip=True)
-                match = re.search(r"-?(\d+)%", discount_text)
+                match = _PERCENT_RE.search(discount_text)
                 if match:
                     discount_percentage = float(match.group(1))
 
@@ -186,28 +251,26 @@ class FarmaciaCatedralProduct:
             bank_discount_percentage = None
 
             # Bank name from header: <h3 class="title-itau">...<img src="..." alt="Logo de Cooperativa Universitaria">
-            bank_header = soup.select_one(".title-itau")
+            bank_header = css(".title-itau").select_one(soup)
             if bank_header:
-                bank_img = bank_header.select_one("img")
+                bank_img = css("img").select_one(bank_header)
                 if bank_img:
                     bank_alt = bank_img.get("alt", "")
                     # Extract bank name from alt text: "Logo de Cooperativa Universitaria"
-                    match = re.search(r"Logo de (.+)", bank_alt)
-                    if match:
-                        bank_discount_bank_name = match.group(1).strip()
+                    bank_discount_bank_name = intern_text(_strip_label(bank_alt, "Logo de"))
 
             # Bank discount price and percentage: <li class="text-descuento">30% en Web/Sucursal.</li> <li>Gs. 31.500</li>
-            bank_list = soup.select(".list-itau li")
+            bank_list = css(".list-itau li").select(soup)
             for li in bank_list:
                 li_text = li.get_text(strip=True)
                 # Discount percentage: "30% en Web/Sucursal."
-                percent_match = re.search(r"(\d+)%", li_text)
+                percent_match = _PERCENT_RE.search(li_text)
                 if percent_match:
                     bank_discount_percentage = float(percent_match.group(1))
                 # Price: "Gs. 31.500"
-                price_match = re.search(r"Gs\.\s*([\d.,]+)", li_text)
+                price_match = _GS_RE.search(li_text)
                 if price_match:
-                    bank_discount_price = float(price_match.group(1).replace(".", "").replace(",", ""))
+                    bank_discount_price = parse_guarani(price_match.group(1))
 
             # Bank payment offers (combined info)
             bank_payment_offers = None
@@ -217,29 +280,25 @@ class FarmaciaCatedralProduct:
             # Prescription requirement
             requires_prescription = False
             prescription_type = None
-            prescription_alert = soup.select_one(".alert.alert-warning")
+            prescription_alert = css(".alert.alert-warning").select_one(soup)
             if prescription_alert:
                 alert_text = prescription_alert.get_text(strip=True)
-                if "receta" in alert_text.lower():
+                if has_any(alert_text, "receta"):
                     requires_prescription = True
                     prescription_type = "Receta médica obligatoria"
 
             # Stock availability
             stock_available = False
-            stock_elem = soup.select_one(".stock-ficha")
+            stock_elem = css(".stock-ficha").select_one(soup)
             if stock_elem:
                 stock_text = stock_elem.get_text(strip=True)
-                if "disponible" in stock_text.lower():
+                if has_any(stock_text, "disponible"):
                     stock_available = True
 
             # Image URL (from JSON-LD or HTML)
-            image_url = None
-            if json_ld and "image" in json_ld:
-                images = json_ld["image"]
-                if isinstance(images, list) and len(images) > 0:
-                    image_url = images[0]
+            image_url = ld_images[0] if isinstance(ld_images, list) and ld_images else None
             if not image_url:
-                image_elem = soup.select_one("img[alt='Imagen de Producto']")
+                image_elem = css("img[alt='Imagen de Producto']").select_one(soup)
                 if image_elem:
                     image_url = image_elem.get("src")
 
@@ -284,9 +343,12 @@ class FarmaciaCatedralProduct:
 # PHASE 1: URL COLLECTION (using JSON API)
 # ==============================================================================
 
-async def collect_urls_from_api() -> int:
+async def collect_urls_from_api(url_queue: Optional[asyncio.Queue] = None) -> int:
     """Phase 1: Fetch product URLs from JSON API and save to database.
 
+    Args:
+        url_queue: If given, each new product URL is also put here as soon as it is seen
+
     Returns:
         Number of unique URLs collected
     """
@@ -311,7 +373,55 @@ async def collect_urls_from_api() -> int:
         (125, "perfumes-y-fragancias"),
     ]
 
-    seen_urls = set()
+    # Keyed on the integer product code in the URL (falls back to the URL itself)
+    seen_products = set()
+    # (product_url, site_code) rows waiting to be written; flushed every URL_BATCH_SIZE rows and at the end
+    pending_rows = []
+
+    async def flush_urls() -> None:
+        global db_loader_instance
+        if db_loader_instance and pending_rows:
+            inserted = await db_loader_instance.insert_product_url_rows("farmacia_catedral", pending_rows)
+            logger.info(f"Saved {inserted} URLs ({len(seen_products)} total)")
+        pending_rows.clear()
+
+    # Pages of a category are fetched a few at a time instead of one after another
+    semaphore = asyncio.Semaphore(API_CONCURRENCY)
+
+    async def fetch_page(client: Any, params: Dict[str, Any], page: int) -> tuple:
+        async with semaphore:
+            try:
+                response = await client.get(api_url, params={**params, "page": page})
+                response.raise_for_status()
+                return page, response.json()
+            except Exception as e:
+                logger.error(f"Error fetching {params['categorias_top']} page {page}: {e}")
+                return page, None
+            finally:
+                # Small delay to be nice to the server
+                await asyncio.sleep(0.1)
+
+    async def collect_page(page_data: Dict[str, Any]) -> None:
+        for product in page_data["paginacion"]["data"]:
+            product_url = product.get("url_ver")
+            if not product_url:
+                continue
+
+            # Skip duplicates
+            url_match = _URL_CODE_RE.search(product_url)
+            key = int(url_match.group(1)) if url_match else product_url
+            if key in seen_products:
+                continue
+            seen_products.add(key)
+
+            # Extract site_code from URL or use codigo_articulo
+            site_code = product.get("codigo_articulo")
+            if not site_code and url_match:
+                site_code = url_match.group(1)
+
+            pending_rows.append((product_url, site_code))
+            if url_queue is not None:
+                await url_queue.put(product_url)
 
     async with httpx.AsyncClient(timeout=30.0) as client:
         for cat_id, cat_name in category_ids:
@@ -336,66 +446,83 @@ async def collect_urls_from_api() -> int:
 
                 logger.info(f"Category {cat_name} (ID {cat_id}): {total_items} products across {total_pages} pages")
 
-                # Loop through all pages
-                for page in range(1, total_pages + 1):
-                    params["page"] = page
-
-                    try:
-                        response = await client.get(api_url, params=params)
-                        response.raise_for_status()
-                        page_data = response.json()
-
-                        products = page_data["paginacion"]["data"]
-                        urls_to_insert = []
-
-                        for product in products:
-                            product_url = product.get("url_ver")
-                            if not product_url:
-                                continue
-
-                            # Skip duplicates
-                            if product_url in seen_urls:
-                                continue
-                            seen_urls.add(product_url)
-
-                            # Extract site_code from URL or use codigo_articulo
-                            site_code = product.get("codigo_articulo")
-                            if not site_code:
-                                url_match = re.search(r"/producto/(\d+)/", product_url)
-                                if url_match:
-                                    site_code = url_match.group(1)
-
-                            urls_to_insert.append({
-                                "pharmacy_source": "farmacia_catedral",
-                                "product_url": product_url,
-                                "site_code": site_code,
-                            })
-
-                        # Save URLs to database
-                        global db_loader_instance
-                        if db_loader_instance and urls_to_insert:
-                            inserted = await db_loader_instance.insert_product_urls(urls_to_insert)
-                            logger.info(f"{cat_name} page {page}/{total_pages}: Saved {inserted} URLs ({len(seen_urls)} total)")
-
-                        # Small delay to be nice to the server
-                        await asyncio.sleep(0.1)
-
-                    except Exception as e:
-                        logger.error(f"Error fetching {cat_name} page {page}: {e}")
-                        continue
+                # Page 1 was already fetched for the totals; the rest are fetched concurrently.
+                # The TaskGroup cancels and awaits the fetches still running if this category fails.
+                await collect_page(data)
+                async with asyncio.TaskGroup() as tg:
+                    tasks = [
+                        tg.create_task(fetch_page(client, params, page))
+                        for page in range(2, total_pages + 1)
+                    ]
+
+                    # Handle pages as they arrive, so DB writes overlap the remaining fetches
+                    for next_page in asyncio.as_completed(tasks):
+                        page, page_data = await next_page
+                        if page_data is None:
+                            continue
+
+                        try:
+                            await collect_page(page_data)
+                        except Exception as e:
+                            logger.error(f"Error parsing {cat_name} page {page}: {e}")
+                            continue
+
+                        logger.info(f"{cat_name} page {page}/{total_pages}: {len(seen_products)} URLs so far")
+                        if len(pending_rows) >= URL_BATCH_SIZE:
+                            await flush_urls()
 
             except Exception as e:
                 logger.error(f"Error fetching category {cat_name} (ID {cat_id}): {e}")
                 continue
 
-    logger.info(f"Finished: {len(seen_urls)} total unique URLs collected from all categories")
-    return len(seen_urls)
+    await flush_urls()
+
+    logger.info(f"Finished: {len(seen_products)} total unique URLs collected from all categories")
+    return len(seen_products)
 
 
 # ==============================================================================
 # PHASE 2: PRODUCT SCRAPING
 # ==============================================================================
 
+async def save_product(product_data: Dict[str, Any]) -> None:
+    """Update the product's database record (upsert on pharmacy_source + site_code)."""
+    global batch_writer_instance
+    if batch_writer_instance:
+        digest = digest_cache_instance.digest(product_data)
+        if digest_cache_instance.is_unchanged(product_data["product_url"], digest):
+            digest_cache_instance.mark_unchanged(product_data["site_code"])
+            logger.info(f"Unchanged, skipping upsert: {product_data['product_name']}")
+            return
+
+        # Written in bulk; the digest is recorded once the batch is saved
+        await batch_writer_instance.add_product(product_data)
+        logger.info(f"Queued: {product_data['product_name']}")
+    else:
+        logger.info(f"No DB loader: {product_data['product_name']}")
+
+
+@http_router.handler("product_detail")
+async def scrape_product_http(context: BeautifulSoupCrawlingContext) -> None:
+    """Phase 2: Scrape a product page from its static HTML (JSON-LD + markup)."""
+    url = context.request.url
+    logger.info(f"Scraping product over HTTP: {url}")
+
+    try:
+        product_data = FarmaciaCatedralProduct.extract_from_soup(context.soup, url)
+
+        if product_data and product_data.get("current_price") is not None:
+            await save_product(product_data)
+        else:
+            logger.warning(f"Incomplete static HTML for {url}, retrying with browser")
+            browser_fallback_urls.append(url)
+
+    except Exception as e:
+        # Handled requests never reach failed_request_handler, so hand it over here
+        logger.error(f"Error scraping product {url}, retrying with browser: {e}")
+        browser_fallback_urls.append(url)
+
+
 @router.handler("product_detail")
 async def scrape_product(context: PlaywrightCrawlingContext) -> None:
     """Phase 2: Scrape product detail page and UPDATE database record."""
@@ -404,7 +531,6 @@ async def scrape_product(context: PlaywrightCrawlingContext) -> None:
     try:
         # Wait for product name to load
         await context.page.wait_for_selector("h1.title-ficha", timeout=10000)
-        await context.page.wait_for_timeout(1000)
 
         # Get page HTML
         html = await context.page.content()
@@ -413,16 +539,7 @@ async def scrape_product(context: PlaywrightCrawlingContext) -> None:
         product_data = FarmaciaCatedralProduct.extract_from_html(html, context.request.url)
 
         if product_data:
-            # Update database record (upsert based on pharmacy_source + product_url)
-            global db_loader_instance
-            if db_loader_instance:
-                product_id = await db_loader_instance.upsert_product(product_data)
-                if product_id:
-                    logger.info(f"Saved: {product_data['product_name']}")
-                else:
-                    logger.warning(f"Failed to save: {product_data['product_name']}")
-            else:
-                logger.info(f"No DB loader: {product_data['product_name']}")
+            await save_product(product_data)
         else:
             logger.warning(f"Failed to extract product from {context.request.url}")
 
@@ -430,6 +547,121 @@ async def scrape_product(context: PlaywrightCrawlingContext) -> None:
         logger.error(f"Error scraping product {context.request.url}: {e}")
 
 
+async def scrape_in_browser(urls: List[str], proxy_configuration: Optional[ProxyConfiguration]) -> None:
+    """
+    Phase 2 fallback: Scrape product pages the HTTP pass could not extract in a real browser.
+
+    Args:
+        urls: Product URLs to retry
+        proxy_configuration: Optional proxy rotation
+    """
+    if not urls:
+        return
+
+    logger.info(f"Retrying {len(urls)} products in the browser...")
+
+    # Separate queue: the default one already holds these URLs as handled
+    request_queue = await RequestQueue.open(name="farmacia-catedral-browser-fallback")
+    crawler = PlaywrightCrawler(
+        request_manager=request_queue,
+        request_handler=router,
+        proxy_configuration=proxy_configuration,
+        max_requests_per_crawl=len(urls) + 100,
+        max_request_retries=2,
+        request_handler_timeout=timedelta(seconds=30),  # 30 seconds per product page
+        # Start at full width: every page is bound by page load, not CPU
+        concurrency_settings=ConcurrencySettings(
+            min_concurrency=BROWSER_CONCURRENCY // 2,
+            desired_concurrency=BROWSER_CONCURRENCY,
+            max_concurrency=BROWSER_CONCURRENCY,
+        ),
+        # Pages share a few long-lived browsers instead of launching per batch
+        browser_pool=build_browser_pool(max_open_pages=BROWSER_CONCURRENCY),
+    )
+
+    @crawler.pre_navigation_hook
+    async def block_resources(context: PlaywrightPreNavCrawlingContext) -> None:
+        context.page.set_default_timeout(PAGE_TIMEOUT_MS)
+        # JSON-LD and markup are all that's parsed; CSS, images and fonts are skipped
+        await block_heavy_resources(context.page)
+
+    try:
+        await crawler.run([
+            Request.from_url(url, label="product_detail") for url in urls
+        ])
+    finally:
+        await request_queue.drop()
+
+
+async def pipeline_worker(client: Any, url_queue: asyncio.Queue) -> int:
+    """
+    Scrape product URLs over HTTP as Phase 1 queues them, until a None sentinel arrives.
+
+    Pages that fail or lack a price are left in browser_fallback_urls.
+
+    Args:
+        client: Shared httpx.AsyncClient
+        url_queue: Queue filled by collect_urls_from_api()
+
+    Returns:
+        Number of products extracted by this worker
+    """
+    scraped = 0
+    while (url := await url_queue.get()) is not None:
+        try:
+            response = await client.get(url)
+            response.raise_for_status()
+            product_data = FarmaciaCatedralProduct.extract_from_html(response.text, url)
+
+            if product_data and product_data.get("current_price") is not None:
+                await save_product(product_data)
+                scraped += 1
+            else:
+                logger.warning(f"Incomplete static HTML for {url}, retrying with browser")
+                browser_fallback_urls.append(url)
+
+        except Exception as e:
+            logger.warning(f"HTTP scrape failed for {url}, retrying with browser: {e}")
+            browser_fallback_urls.append(url)
+
+    return scraped
+
+
+async def collect_and_scrape(proxy_configuration: Optional[ProxyConfiguration]) -> tuple:
+    """
+    Phase 1 + 2 pipeline: Scrape products while their URLs are still being collected.
+
+    URLs are still saved to the database by Phase 1, but products no longer
+    wait for collection to finish or for a database read in between.
+
+    Args:
+        proxy_configuration: Optional proxy rotation for the browser fallback
+
+    Returns:
+        (URLs collected, products scraped over HTTP)
+    """
+    import httpx
+
+    url_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+
+    async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
+        # If a worker dies, the TaskGroup cancels collection instead of leaving it
+        # blocked on a full queue that nobody drains
+        async with asyncio.TaskGroup() as tg:
+            workers = [
+                tg.create_task(pipeline_worker(client, url_queue))
+                for _ in range(PIPELINE_WORKERS)
+            ]
+            total_urls = await collect_urls_from_api(url_queue)
+            # One sentinel per worker, so each drains the queue and exits
+            for _ in workers:
+                await url_queue.put(None)
+        scraped = sum(worker.result() for worker in workers)
+
+    await scrape_in_browser(browser_fallback_urls, proxy_configuration)
+    return total_urls, scraped
+
+
 # ==============================================================================
 # MAIN
 # ==============================================================================
@@ -438,9 +670,9 @@ async def main(phase: str = None) -> None:
     """Run Farmacia Catedral scraper.
 
     Args:
-        phase: Scraping phase ("phase1" or "phase2"). If None, determined from CLI args or defaults to "phase1".
+        phase: Scraping phase ("phase1", "phase2" or "pipeline"). If None, determined from CLI args or defaults to "phase1".
     """
-    global db_loader_instance
+    global db_loader_instance, batch_writer_instance
 
     settings = get_settings()
     base_url = PHARMACY_URLS["farmacia_catedral"]["base_url"]
@@ -513,28 +745,43 @@ async def main(phase: str = None) -> None:
         run_id = await db_loader.start_scraping_run("farmacia_catedral", f"phase2_{len(urls_to_scrape)}_products")
 
         try:
-            crawler = PlaywrightCrawler(
-                request_handler=router,
+            # Enqueue all product URLs
+            requests = [
+                Request.from_url(url, label="product_detail") for url in urls_to_scrape
+            ]
+
+            logger.info(f"Starting scraping of {len(requests)} products over HTTP...")
+
+            http_crawler = BeautifulSoupCrawler(
+                request_handler=http_router,
+                parser=HTML_PARSER,
                 proxy_configuration=proxy_configuration,
                 max_requests_per_crawl=len(urls_to_scrape) + 100,
                 max_request_retries=2,
-                request_handler_timeout=timedelta(seconds=30),  # 30 seconds per product page
-                concurrency_settings=ConcurrencySettings(max_concurrency=20),  # Increased concurrency for faster scraping
-                headless=True,
-                browser_launch_options={"args": ["--no-sandbox", "--disable-setuid-sandbox"]},
+                request_handler_timeout=timedelta(seconds=30),
+                concurrency_settings=ConcurrencySettings(max_concurrency=20),
             )
 
-            # Enqueue all product URLs
-            requests = [
-                Request.from_url(url, label="product_detail") for url in urls_to_scrape
-            ]
+            @http_crawler.failed_request_handler
+            async def http_failed(context: BeautifulSoupCrawlingContext, error: Exception) -> None:
+                browser_fallback_urls.append(context.request.url)
+
+            # Both crawlers queue products into one writer; leaving it flushes the last batch
+            async with BatchWriter(db_loader, on_saved=digest_cache_instance.mark_product_saved) as writer:
+                batch_writer_instance = writer
+                try:
+                    await http_crawler.run(requests)
 
-            logger.info(f"Starting scraping of {len(requests)} products...")
+                    await scrape_in_browser(browser_fallback_urls, proxy_configuration)
+                finally:
+                    batch_writer_instance = None
 
-            await crawler.run(requests)
+            # Unchanged products skipped their upsert; refresh scraped_at in bulk instead
+            await db_loader.touch_products("farmacia_catedral", digest_cache_instance.unchanged_site_codes)
+            digest_cache_instance.save()
 
             # Get final count
-            dataset = await crawler.get_dataset()
+            dataset = await http_crawler.get_dataset()
             data = await dataset.get_data()
             total_scraped = len(data.items)
 
@@ -549,8 +796,40 @@ async def main(phase: str = None) -> None:
             await db_loader.complete_scraping_run(run_id, 0, 0, str(e))
             raise
 
+    elif phase == "pipeline":
+        # ============================================================
+        # PHASE 1 + 2: SCRAPE PRODUCTS AS THEIR URLS ARE COLLECTED
+        # ============================================================
+        logger.info("=" * 80)
+        logger.info("PIPELINE: Collecting URLs and scraping products concurrently")
+        logger.info("=" * 80)
+
+        run_id = await db_loader.start_scraping_run("farmacia_catedral", "pipeline_all_categories")
+
+        try:
+            async with BatchWriter(db_loader, on_saved=digest_cache_instance.mark_product_saved) as writer:
+                batch_writer_instance = writer
+                try:
+                    total_urls, total_scraped = await collect_and_scrape(proxy_configuration)
+                finally:
+                    batch_writer_instance = None
+
+            await db_loader.touch_products("farmacia_catedral", digest_cache_instance.unchanged_site_codes)
+            digest_cache_instance.save()
+
+            logger.info("=" * 80)
+            logger.info(f"PIPELINE COMPLETE: {total_urls} URLs collected, {total_scraped} products scraped over HTTP")
+            logger.info("=" * 80)
+
+            await db_loader.complete_scraping_run(run_id, total_scraped, 0)
+
+        except Exception as e:
+            logger.error(f"Pipeline failed: {e}")
+            await db_loader.complete_scraping_run(run_id, 0, 0, str(e))
+            raise
+
     else:
-        logger.error(f"Unknown phase: {phase}. Use 'phase1' or 'phase2'")
+        logger.error(f"Unknown phase: {phase}. Use 'phase1', 'phase2' or 'pipeline'")
         sys.exit(1)
 
 
@@ -1,23 +1,32 @@
 """Farmacia Center scraper for pharmaceutical products - 2-PHASE APPROACH.
 
 Phase 1: Scroll and save all product URLs to database
-Phase 2: Scrape each URL from database
+Phase 2: Scrape each URL from database over HTTP, retrying failures in a browser
 """
 
 import asyncio
-import json
 import re
 import sys
 from datetime import timedelta
+from html import unescape
 from typing import Any, Dict, List, Optional
 from crawlee import Request, ConcurrencySettings
-from crawlee.crawlers import PlaywrightCrawler, PlaywrightCrawlingContext
+from crawlee.crawlers import (
+    HttpCrawler,
+    HttpCrawlingContext,
+    PlaywrightCrawler,
+    PlaywrightCrawlingContext,
+    PlaywrightPreNavCrawlingContext,
+)
 from crawlee.proxy_configuration import ProxyConfiguration
 from crawlee.router import Router
-from bs4 import BeautifulSoup
+from crawlee.storages import RequestQueue
+from bs4 import SoupStrainer
 from utils.config import get_settings, PHARMACY_URLS
+from utils.crawling import PAGE_TIMEOUT_MS, block_heavy_resources, build_browser_pool
 from utils.logger import setup_logger, get_logger
-from storage.supabase_loader import SupabaseLoader
+from utils.parsing import css, json_loads, make_soup, parse_guarani
+from storage.supabase_loader import BatchWriter, SupabaseLoader
 
 # Setup logger
 setup_logger()
@@ -26,9 +35,84 @@ logger = get_logger()
 # Create router for handling different page types
 router = Router()
 
+# Product pages are server-rendered, so phase 2 fetches them over plain HTTP first
+http_router = Router[HttpCrawlingContext]()
+
+# Product URLs the HTTP pass could not extract, retried in a real browser
+browser_fallback_urls: List[str] = []
+
 # Global db_loader instance (will be set in main())
 db_loader_instance = None
 
+# Buffers product upserts into bulk writes (set for the duration of Phase 2)
+batch_writer_instance = None
+
+# Containers of every element the extractor reads (hidden JSON input, microdata,
+# title, prices, images, bank discounts); skips <head>, scripts and styles while parsing
+_PRODUCT_STRAINER = SoupStrainer(["input", "main", "section", "div", "h1", "img"])
+
+# Listing pages after the first are read only for their product links
+_LISTING_LINK_STRAINER = SoupStrainer("a")
+
+# Compiled once at import instead of looked up in re's cache on every page
+# Hidden product JSON: <input type="hidden" class="json" value="{&quot;producto&quot;: ...}">
+_JSON_INPUT_RE = re.compile(r'<input\b[^>]*\bclass="json"[^>]*\bvalue="([^"]*)"')
+_DATA_TIT_BRAND_RE = re.compile(r"(?:Medicamentos|Suplementos)\s+(.+)", re.IGNORECASE)
+_DATA_TIT_CATEGORY_RE = re.compile(r"^(\w+)")
+_BANK_DESC_CLASS_RE = re.compile(r"desc_\d+")
+
+# Every product row in column order; values that never vary on this site are filled in,
+# per-page ones are set by the extractor (mutable values are never shared via the template)
+_PRODUCT_TEMPLATE: Dict[str, Any] = {
+    "site_code": None,
+    "barcode": None,
+    "product_name": None,
+    "brand": None,
+    "product_description": None,
+    "product_details": None,
+    "category_path": None,
+    "main_category": None,
+    "current_price": None,
+    "original_price": None,
+    "discount_percentage": None,
+    "discount_amount": None,
+    "bank_discount_price": None,
+    "bank_discount_bank_name": None,
+    "bank_payment_offers": None,
+    "requires_prescription": False,  # Not visible on page
+    "prescription_type": None,
+    "payment_methods": None,
+    "shipping_options": None,
+    "image_url": None,
+    "image_urls": None,
+    "pharmacy_source": "farma_center",
+    "product_url": None,
+}
+
+# Phase 1 writes collected URLs in bulk upserts of this many rows, so one failed
+# request loses at most a batch rather than the whole run (~4,200 unique URLs)
+URL_BATCH_SIZE = 1000
+# Phase 1 listing pages fetched at once per category
+LISTING_CONCURRENCY = 20
+# Phase 2 products per bulk upsert; the HTTP pass produces rows faster than the default 200 drain
+UPSERT_BATCH_SIZE = 500
+# Phase 2 product pages fetched at once over HTTP
+HTTP_CONCURRENCY = 32
+# Phase 2 browser fallback: pages open at once across the shared browser pool
+BROWSER_CONCURRENCY = 20
+
+
+def _url_site_code(url: str) -> Optional[str]:
+    """
+    Return the site code from a product URL ending in _<site_code>_<number>.
+
+    Example: /catalogo/somero-..._10030893_10030893 -> "10030893"
+    """
+    parts = url.rsplit("_", 2)
+    if len(parts) == 3 and parts[1].isdecimal() and parts[2].isdecimal():
+        return parts[1]
+    return None
+
 
 class FarmaciaCenterProduct:
     """Data class for Farmacia Center product extraction."""
@@ -46,38 +130,52 @@ class FarmaciaCenterProduct:
             Dictionary with product data, or None if extraction fails
         """
         try:
-            soup = BeautifulSoup(html, "html.parser")
-
             # Extract JSON data from hidden input (most reliable source)
+            # Read straight from the raw HTML; the tree is searched only if the attributes differ
+            json_value = None
+            json_match = _JSON_INPUT_RE.search(html)
+            if json_match:
+                # The value is HTML-escaped JSON
+                json_value = unescape(json_match.group(1))
+
+            soup = make_soup(html, parse_only=_PRODUCT_STRAINER)
+
+            if json_value is None:
+                json_input = css("input.json[type='hidden']").select_one(soup)
+                if json_input:
+                    # BeautifulSoup already decodes the attribute
+                    json_value = json_input.get("value", "")
+
             json_data = None
-            json_input = soup.find("input", class_="json", type="hidden")
-            if json_input:
-                json_value = json_input.get("value", "")
-                if json_value:
-                    try:
-                        # The value is HTML-escaped JSON, BeautifulSoup already decodes it
-                        json_data = json.loads(json_value)
-                        logger.debug(f"Found JSON data for product")
-                    except json.JSONDecodeError as e:
-                        logger.warning(f"Failed to parse JSON data: {e}")
+            if json_value:
+                try:
+                    json_data = json_loads(json_value)
+                    logger.debug(f"Found JSON data for product")
+                except ValueError as e:
+                    logger.warning(f"Failed to parse JSON data: {e}")
 
             # Extract Microdata (schema.org/Product) from hidden div
-            microdata = soup.find("div", attrs={"itemtype": "http://schema.org/Product"})
+            microdata = css("div[itemtype='http://schema.org/Product']").select_one(soup)
+
+            # One pass over the microdata properties; the first element per itemprop wins
+            itemprops = {}
             if microdata:
                 logger.debug(f"Found Microdata for Product")
+                for prop_elem in css("[itemprop]").select(microdata):
+                    itemprops.setdefault(prop_elem["itemprop"], prop_elem)
 
             # Product name (priority: JSON > Microdata > h1.tit)
             product_name = None
             if json_data and "producto" in json_data:
                 product_name = json_data["producto"].get("nombre")
 
-            if not product_name and microdata:
-                name_elem = microdata.find(attrs={"itemprop": "name"})
+            if not product_name:
+                name_elem = itemprops.get("name")
                 if name_elem:
                     product_name = name_elem.get_text(strip=True)
 
             if not product_name:
-                product_name_elem = soup.select_one("h1.tit")
+                product_name_elem = css("h1.tit").select_one(soup)
                 product_name = product_name_elem.get_text(strip=True) if product_name_elem else None
 
             if not product_name:
@@ -89,17 +187,16 @@ class FarmaciaCenterProduct:
             barcode = None
 
             # From Microdata: <span itemprop="sku">1002677810026778</span>
-            if microdata:
-                sku_elem = microdata.find(attrs={"itemprop": "sku"})
-                if sku_elem:
-                    sku_text = sku_elem.get_text(strip=True)
-                    # SKU format: "1002677810026778" (site_code + barcode concatenated)
-                    # Based on the description pattern in microdata, it's sitecode-barcode
-                    # But in SKU it's concatenated. Let's check .cod div for split version
-                    site_code = sku_text
+            sku_elem = itemprops.get("sku")
+            if sku_elem:
+                sku_text = sku_elem.get_text(strip=True)
+                # SKU format: "1002677810026778" (site_code + barcode concatenated)
+                # Based on the description pattern in microdata, it's sitecode-barcode
+                # But in SKU it's concatenated. Let's check .cod div for split version
+                site_code = sku_text
 
             # From HTML: .cod div: "10030348-7703281002468" (more reliable for split)
-            cod_div = soup.select_one(".cod")
+            cod_div = css(".cod").select_one(soup)
             if cod_div:
                 cod_text = cod_div.get_text(strip=True)
                 # Split on hyphen: first part is site_code, second is barcode
@@ -112,27 +209,25 @@ class FarmaciaCenterProduct:
 
             # Fallback: extract from URL pattern ..._<site_code>_<site_code>$
             if not site_code:
-                url_match = re.search(r"_(\d+)_\d+$", url)
-                if url_match:
-                    site_code = url_match.group(1)
+                site_code = _url_site_code(url)
 
             # Brand (priority: JSON > Microdata > data-tit)
             brand = None
             if json_data and "producto" in json_data:
                 brand = json_data["producto"].get("marca")
 
-            if not brand and microdata:
-                brand_elem = microdata.find(attrs={"itemprop": "brand"})
+            if not brand:
+                brand_elem = itemprops.get("brand")
                 if brand_elem:
                     brand = brand_elem.get_text(strip=True)
 
             # Fallback to data-tit attribute: "Medicamentos ABBOTT "
             if not brand:
-                central_div = soup.select_one("#central[data-tit]")
+                central_div = css("#central[data-tit]").select_one(soup)
                 if central_div:
                     data_tit = central_div.get("data-tit", "")
                     # Extract brand from "Medicamentos ABBOTT " or similar
-                    match = re.search(r"(?:Medicamentos|Suplementos)\s+(.+)", data_tit, re.IGNORECASE)
+                    match = _DATA_TIT_BRAND_RE.search(data_tit)
                     if match:
                         brand = match.group(1).strip()
 
@@ -149,26 +244,25 @@ class FarmaciaCenterProduct:
 
             # Fallback to data-tit
             if not main_category:
-                central_div = soup.select_one("#central[data-tit]")
+                central_div = css("#central[data-tit]").select_one(soup)
                 if central_div:
                     data_tit = central_div.get("data-tit", "")
                     if data_tit:
                         # First word is the category: "Medicamentos" or "Suplementos"
-                        category_match = re.match(r"^(\w+)", data_tit)
+                        category_match = _DATA_TIT_CATEGORY_RE.match(data_tit)
                         if category_match:
                             main_category = category_match.group(1)
                             category_path = [main_category]
 
             # Description (from Microdata or HTML)
             product_description = None
-            if microdata:
-                desc_elem = microdata.find(attrs={"itemprop": "description"})
-                if desc_elem:
-                    product_description = desc_elem.get_text(strip=True)
+            desc_elem = itemprops.get("description")
+            if desc_elem:
+                product_description = desc_elem.get_text(strip=True)
 
             # Fallback to HTML: <div class="desc"><p>...</p></div>
             if not product_description:
-                desc_div = soup.select_one(".desc p")
+                desc_div = css(".desc p").select_one(soup)
                 if desc_div:
                     product_description = desc_div.get_text(strip=True)
 
@@ -179,21 +273,14 @@ class FarmaciaCenterProduct:
             discount_amount = None
 
             # Original price (lista): <del class="precio lista"><span class="monto">230.000</span></del>
-            original_price_elem = soup.select_one(".precios del.precio.lista .monto")
+            original_price_elem = css(".precios del.precio.lista .monto").select_one(soup)
             if original_price_elem:
-                price_text = original_price_elem.get_text(strip=True)
-                # Remove dots and convert to float
-                price_clean = price_text.replace(".", "").replace(",", "")
-                if price_clean.isdigit():
-                    original_price = float(price_clean)
+                original_price = parse_guarani(original_price_elem.get_text(strip=True))
 
             # Current price (venta): <strong class="precio venta"><span class="monto">193.200</span></strong>
-            current_price_elem = soup.select_one(".precios strong.precio.venta .monto")
+            current_price_elem = css(".precios strong.precio.venta .monto").select_one(soup)
             if current_price_elem:
-                price_text = current_price_elem.get_text(strip=True)
-                price_clean = price_text.replace(".", "").replace(",", "")
-                if price_clean.isdigit():
-                    current_price = float(price_clean)
+                current_price = parse_guarani(current_price_elem.get_text(strip=True))
 
             # Calculate discount if both prices exist
             if current_price and original_price:
@@ -207,7 +294,7 @@ class FarmaciaCenterProduct:
 
             # Image URL: find product image in HTML (catalogo images, not logo/icons)
             image_url = None
-            for img in soup.select("img[src*='/catalogo/']"):
+            for img in css("img[src*='/catalogo/']").select(soup):
                 src = img.get("src", "")
                 if "1000x1000" in src or "1024-1024" in src:
                     image_url = f"https:{src}" if src.startswith("//") else src
@@ -238,29 +325,28 @@ class FarmaciaCenterProduct:
             bank_discount_bank_name = None
             bank_payment_offers = None
 
-            descuentos_mdp = soup.select_one(".descuentosMDP")
+            descuentos_mdp = css(".descuentosMDP").select_one(soup)
             if descuentos_mdp:
                 # Find all bank discount sections (there might be multiple)
-                desc_divs = descuentos_mdp.find_all("div", class_=re.compile(r"desc_\d+"))
+                desc_divs = descuentos_mdp.find_all("div", class_=_BANK_DESC_CLASS_RE)
 
                 bank_names = []
                 bank_prices = []
 
                 for desc_div in desc_divs:
                     # Extract bank name from title attribute
-                    bank_img = desc_div.select_one(".img[title]")
+                    bank_img = css(".img[title]").select_one(desc_div)
                     if bank_img:
                         bank_name = bank_img.get("title", "").strip()
                         if bank_name:
                             bank_names.append(bank_name)
 
                     # Extract bank discount price
-                    monto_elem = desc_div.select_one(".precio .monto")
+                    monto_elem = css(".precio .monto").select_one(desc_div)
                     if monto_elem:
-                        price_text = monto_elem.get_text(strip=True)
-                        price_clean = price_text.replace(".", "").replace(",", "")
-                        if price_clean.isdigit():
-                            bank_prices.append(float(price_clean))
+                        bank_price = parse_guarani(monto_elem.get_text(strip=True))
+                        if bank_price is not None:
+                            bank_prices.append(bank_price)
 
                 # Use the lowest price if multiple banks
                 if bank_names and bank_prices:
@@ -268,8 +354,9 @@ class FarmaciaCenterProduct:
                     bank_discount_price = min(bank_prices)  # Best price for customer
                     bank_payment_offers = f"Descuento exclusivo con {bank_discount_bank_name}"
 
-            # Build product dictionary
-            product_data = {
+            # Build product dictionary: constant fields come from the template
+            product_data = _PRODUCT_TEMPLATE.copy()
+            product_data.update({
                 "site_code": site_code,
                 "barcode": barcode,
                 "product_name": product_name,
@@ -285,15 +372,10 @@ class FarmaciaCenterProduct:
                 "bank_discount_price": bank_discount_price,
                 "bank_discount_bank_name": bank_discount_bank_name,
                 "bank_payment_offers": bank_payment_offers,
-                "requires_prescription": False,  # Not visible on page
-                "prescription_type": None,
-                "payment_methods": None,
-                "shipping_options": None,
                 "image_url": image_url,
                 "image_urls": [image_url] if image_url else [],
-                "pharmacy_source": "farma_center",
                 "product_url": url,
-            }
+            })
 
             logger.debug(f"Extracted product: {product_name} (code: {site_code}, barcode: {barcode})")
             logger.debug(f"Brand: {brand}, Category: {main_category}, Description: {product_description[:50] if product_description else None}")
@@ -331,8 +413,49 @@ async def collect_urls_from_pages() -> int:
     ]
 
     seen_urls = set()
+    # (product_url, site_code) rows waiting to be written; flushed every URL_BATCH_SIZE rows and at the end
+    pending_rows = []
+
+    async def flush_urls() -> None:
+        global db_loader_instance
+        if db_loader_instance and pending_rows:
+            inserted = await db_loader_instance.insert_product_url_rows("farma_center", pending_rows)
+            logger.info(f"Saved {inserted} URLs ({len(seen_urls)} total)")
+        pending_rows.clear()
+
+    # Listing pages of a category are fetched a few at a time instead of one after another
+    semaphore = asyncio.Semaphore(LISTING_CONCURRENCY)
 
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    async def fetch_page(client: Any, url_template: str, page: int) -> tuple:
+        async with semaphore:
+            try:
+                response = await client.get(url_template.format(page=page))
+                response.raise_for_status()
+                return page, response.text
+            except Exception as e:
+                logger.error(f"Error fetching {url_template.format(page=page)}: {e}")
+                return page, None
+            finally:
+                # Small delay to be nice to the server
+                await asyncio.sleep(0.1)
+
+    def collect_page(soup: Any) -> None:
+        for link in css("a.img[href*='/catalogo/']").select(soup):
+            href = link.get("href")
+            if not href:
+                continue
+
+            # Skip duplicates
+            if href in seen_urls:
+                continue
+            seen_urls.add(href)
+
+            # Extract site_code from URL: /catalogo/somero-..._10030893_10030893
+            pending_rows.append((href, _url_site_code(href)))
+
+    # One HTTP/2 connection multiplexes the concurrent listing requests instead of one TLS handshake each
+    limits = httpx.Limits(max_connections=LISTING_CONCURRENCY, max_keepalive_connections=LISTING_CONCURRENCY)
+    async with httpx.AsyncClient(http2=True, timeout=30.0, limits=limits) as client:
         for category_slug in category_slugs:
             url_template = f"{base_url}/{category_slug}?js=1&pag={{page}}"
             logger.info(f"Fetching category: {category_slug}")
@@ -342,10 +465,10 @@ async def collect_urls_from_pages() -> int:
                 response = await client.get(url_template.format(page=1))
                 response.raise_for_status()
 
-                soup = BeautifulSoup(response.text, "html.parser")
+                soup = make_soup(response.text)
 
                 # Get total from data-total attribute
-                central = soup.select_one("#central[data-total]")
+                central = css("#central[data-total]").select_one(soup)
                 if not central:
                     logger.warning(f"Could not find total products for {category_slug}, skipping")
                     continue
@@ -356,57 +479,35 @@ async def collect_urls_from_pages() -> int:
 
                 logger.info(f"Category {category_slug}: {total_products} products across ~{total_pages} pages")
 
-                # Loop through all pages
-                for page in range(1, total_pages + 1):
-                    try:
-                        response = await client.get(url_template.format(page=page))
-                        response.raise_for_status()
-
-                        soup = BeautifulSoup(response.text, "html.parser")
-
-                        # Extract product links
-                        product_links = soup.select("a.img[href*='/catalogo/']")
-                        urls_to_insert = []
-
-                        for link in product_links:
-                            href = link.get("href")
-                            if not href:
-                                continue
-
-                            # Skip duplicates
-                            if href in seen_urls:
-                                continue
-                            seen_urls.add(href)
-
-                            # Extract site_code from URL: /catalogo/somero-..._10030893_10030893
-                            site_code = None
-                            url_match = re.search(r"_(\d+)_\d+$", href)
-                            if url_match:
-                                site_code = url_match.group(1)
-
-                            urls_to_insert.append({
-                                "pharmacy_source": "farma_center",
-                                "product_url": href,
-                                "site_code": site_code,
-                            })
-
-                        # Save URLs to database
-                        global db_loader_instance
-                        if db_loader_instance and urls_to_insert:
-                            inserted = await db_loader_instance.insert_product_urls(urls_to_insert)
-                            logger.info(f"{category_slug} page {page}/{total_pages}: Saved {inserted} URLs ({len(seen_urls)} total)")
-
-                        # Small delay to be nice to the server
-                        await asyncio.sleep(0.1)
+                # Page 1 was already fetched for the totals; the rest are fetched concurrently
+                collect_page(soup)
+                tasks = [
+                    asyncio.create_task(fetch_page(client, url_template, page))
+                    for page in range(2, total_pages + 1)
+                ]
+
+                # Handle pages as they arrive, so parsing and DB writes overlap the remaining fetches
+                for next_page in asyncio.as_completed(tasks):
+                    page, html = await next_page
+                    if html is None:
+                        continue
 
+                    try:
+                        collect_page(make_soup(html, parse_only=_LISTING_LINK_STRAINER))
                     except Exception as e:
-                        logger.error(f"Error fetching {category_slug} page {page}: {e}")
+                        logger.error(f"Error parsing {category_slug} page {page}: {e}")
                         continue
 
+                    logger.info(f"{category_slug} page {page}/{total_pages}: {len(seen_urls)} URLs so far")
+                    if len(pending_rows) >= URL_BATCH_SIZE:
+                        await flush_urls()
+
             except Exception as e:
                 logger.error(f"Error fetching category {category_slug}: {e}")
                 continue
 
+    await flush_urls()
+
     logger.info(f"Finished: {len(seen_urls)} total unique URLs collected from all categories")
     return len(seen_urls)
 
@@ -415,42 +516,70 @@ async def collect_urls_from_pages() -> int:
 # PHASE 2: PRODUCT SCRAPING
 # ==============================================================================
 
+async def save_product(product_data: Dict[str, Any]) -> None:
+    """Update the product's database record (upsert based on pharmacy_source + product_url)."""
+    # Refuse to upsert without a parsed site_code: the unique constraint
+    # treats NULL as distinct, so a NULL would create a new corrupted
+    # row each scrape (788 such zombies accumulated historically).
+    if not product_data.get("site_code"):
+        logger.warning(f"Skipping upsert for {product_data['product_url']}: no site_code parsed")
+        return
+
+    global batch_writer_instance
+    if batch_writer_instance:
+        # Written in bulk with the rest of the batch
+        await batch_writer_instance.add_product(product_data)
+        logger.info(f"Queued: {product_data['product_name']}")
+    else:
+        logger.info(f"No DB loader: {product_data['product_name']}")
+
+
+@http_router.handler("product_detail")
+async def scrape_product_http(context: HttpCrawlingContext) -> None:
+    """Phase 2: Scrape a product page from its server-rendered HTML (hidden JSON + microdata)."""
+    url = context.request.url
+    logger.info(f"Scraping product over HTTP: {url}")
+
+    try:
+        # Raw body: the extractor regex-scans it and parses only the product containers
+        html = (await context.http_response.read()).decode("utf-8", errors="replace")
+        product_data = FarmaciaCenterProduct.extract_from_html(html, url)
+
+        if product_data and product_data.get("current_price") is not None:
+            await context.push_data(product_data)
+            await save_product(product_data)
+        else:
+            logger.warning(f"Incomplete static HTML for {url}, retrying with browser")
+            browser_fallback_urls.append(url)
+
+    except Exception as e:
+        # Handled requests never reach failed_request_handler, so hand it over here
+        logger.error(f"Error scraping product {url}, retrying with browser: {e}")
+        browser_fallback_urls.append(url)
+
+
 @router.handler("product_detail")
 async def scrape_product(context: PlaywrightCrawlingContext) -> None:
     """Phase 2: Scrape product detail page and UPDATE database record."""
     logger.info(f"Scraping product: {context.request.url}")
 
     try:
-        # Wait for product name to load
-        await context.page.wait_for_selector("h1.tit", timeout=10000)
-        await context.page.wait_for_timeout(1000)
+        # Wait for product name to be in the DOM (visibility doesn't matter to the parser)
+        await context.page.wait_for_selector("h1.tit", state="attached", timeout=10000)
 
-        # Get page HTML
-        html = await context.page.content()
+        # The document as served: pages that only failed over HTTP (blocks, timeouts) are
+        # complete here, without serializing the live DOM
+        html = await context.response.text() if context.response else None
+        product_data = FarmaciaCenterProduct.extract_from_html(html, context.request.url) if html else None
 
-        # Extract product data
-        product_data = FarmaciaCenterProduct.extract_from_html(html, context.request.url)
+        # Pages whose prices are filled in by JavaScript need the rendered DOM
+        if not product_data or product_data.get("current_price") is None:
+            html = await context.page.content()
+            product_data = FarmaciaCenterProduct.extract_from_html(html, context.request.url)
 
         if product_data:
-            # Refuse to upsert without a parsed site_code: the unique constraint
-            # treats NULL as distinct, so a NULL would create a new corrupted
-            # row each scrape (788 such zombies accumulated historically).
-            if not product_data.get("site_code"):
-                logger.warning(
-                    f"Skipping upsert for {context.request.url}: no site_code parsed"
-                )
-                return
-
-            # Update database record (upsert based on pharmacy_source + product_url)
-            global db_loader_instance
-            if db_loader_instance:
-                product_id = await db_loader_instance.upsert_product(product_data)
-                if product_id:
-                    logger.info(f"Saved: {product_data['product_name']}")
-                else:
-                    logger.warning(f"Failed to save: {product_data['product_name']}")
-            else:
-                logger.info(f"No DB loader: {product_data['product_name']}")
+            await context.push_data(product_data)
+            await save_product(product_data)
         else:
             logger.warning(f"Failed to extract product from {context.request.url}")
 
@@ -458,6 +587,91 @@ async def scrape_product(context: PlaywrightCrawlingContext) -> None:
         logger.error(f"Error scraping product {context.request.url}: {e}")
 
 
+async def scrape_products(urls_to_scrape: List[str], proxy_configuration: Optional[ProxyConfiguration]) -> int:
+    """
+    Phase 2: Scrape product pages over HTTP, retrying failures in a browser.
+
+    Args:
+        urls_to_scrape: Product URLs to scrape
+        proxy_configuration: Optional proxy rotation
+
+    Returns:
+        Number of products scraped
+    """
+    requests = [
+        Request.from_url(url, label="product_detail") for url in urls_to_scrape
+    ]
+
+    logger.info(f"Starting scraping of {len(requests)} products over HTTP...")
+
+    http_crawler = HttpCrawler(
+        request_handler=http_router,
+        proxy_configuration=proxy_configuration,
+        max_requests_per_crawl=len(urls_to_scrape) + 100,
+        max_request_retries=2,
+        request_handler_timeout=timedelta(seconds=15),  # A static page either arrives fast or goes to the browser
+        # Start at full width: the autoscaler would otherwise ramp up from a handful of requests
+        concurrency_settings=ConcurrencySettings(
+            min_concurrency=HTTP_CONCURRENCY // 2,
+            desired_concurrency=HTTP_CONCURRENCY,
+            max_concurrency=HTTP_CONCURRENCY,
+        ),
+    )
+
+    @http_crawler.failed_request_handler
+    async def http_failed(context: HttpCrawlingContext, error: Exception) -> None:
+        browser_fallback_urls.append(context.request.url)
+
+    # Both crawlers queue products into one writer; leaving it flushes the last batch
+    global batch_writer_instance
+    async with BatchWriter(db_loader_instance, batch_size=UPSERT_BATCH_SIZE) as writer:
+        batch_writer_instance = writer
+        try:
+            await http_crawler.run(requests)
+
+            if browser_fallback_urls:
+                logger.info(f"Retrying {len(browser_fallback_urls)} products in the browser...")
+
+                # Separate queue: the default one already holds these URLs as handled
+                request_queue = await RequestQueue.open(name="farma-center-browser-fallback")
+                crawler = PlaywrightCrawler(
+                    request_manager=request_queue,
+                    request_handler=router,
+                    proxy_configuration=proxy_configuration,
+                    max_requests_per_crawl=len(browser_fallback_urls) + 100,
+                    max_request_retries=2,
+                    request_handler_timeout=timedelta(seconds=30),  # 30 seconds per product page
+                    # Start high so the autoscaler doesn't sit at a low concurrency on network-bound pages
+                    concurrency_settings=ConcurrencySettings(
+                        min_concurrency=8,
+                        desired_concurrency=12,
+                        max_concurrency=BROWSER_CONCURRENCY,
+                    ),
+                    # Pages share a few long-lived browsers instead of launching per batch
+                    browser_pool=build_browser_pool(max_open_pages=BROWSER_CONCURRENCY),
+                )
+
+                @crawler.pre_navigation_hook
+                async def block_resources(context: PlaywrightPreNavCrawlingContext) -> None:
+                    context.page.set_default_timeout(PAGE_TIMEOUT_MS)
+                    # Only markup and microdata are parsed; CSS, images, fonts and trackers are skipped
+                    await block_heavy_resources(context.page)
+
+                try:
+                    await crawler.run([
+                        Request.from_url(url, label="product_detail") for url in browser_fallback_urls
+                    ])
+                finally:
+                    await request_queue.drop()
+        finally:
+            batch_writer_instance = None
+
+    # Both crawlers push extracted products to the default dataset
+    dataset = await http_crawler.get_dataset()
+    data = await dataset.get_data()
+    return len(data.items)
+
+
 # ==============================================================================
 # MAIN
 # ==============================================================================
@@ -541,30 +755,7 @@ async def main(phase: str = None) -> None:
         run_id = await db_loader.start_scraping_run("farma_center", f"phase2_{len(urls_to_scrape)}_products")
 
         try:
-            crawler = PlaywrightCrawler(
-                request_handler=router,
-                proxy_configuration=proxy_configuration,
-                max_requests_per_crawl=len(urls_to_scrape) + 100,
-                max_request_retries=2,
-                request_handler_timeout=timedelta(seconds=30),  # 30 seconds per product page
-                concurrency_settings=ConcurrencySettings(max_concurrency=20),  # Increased concurrency for faster scraping
-                headless=True,
-                browser_launch_options={"args": ["--no-sandbox", "--disable-setuid-sandbox"]},
-            )
-
-            # Enqueue all product URLs
-            requests = [
-                Request.from_url(url, label="product_detail") for url in urls_to_scrape
-            ]
-
-            logger.info(f"Starting scraping of {len(requests)} products...")
-
-            await crawler.run(requests)
-
-            # Get final count
-            dataset = await crawler.get_dataset()
-            data = await dataset.get_data()
-            total_scraped = len(data.items)
+            total_scraped = await scrape_products(urls_to_scrape, proxy_configuration)
 
             logger.info("=" * 80)
             logger.info(f"PHASE 2 COMPLETE: {total_scraped} products scraped!")
@@ -11,13 +11,22 @@ import sys
 from datetime import datetime, date, timedelta
 from typing import Any, Dict, List, Optional
 from crawlee import Request, ConcurrencySettings
-from crawlee.crawlers import PlaywrightCrawler, PlaywrightCrawlingContext
+from crawlee.crawlers import (
+    BeautifulSoupCrawler,
+    BeautifulSoupCrawlingContext,
+    PlaywrightCrawler,
+    PlaywrightCrawlingContext,
+    PlaywrightPreNavCrawlingContext,
+)
 from crawlee.proxy_configuration import ProxyConfiguration
 from crawlee.router import Router
+from crawlee.storages import RequestQueue
 from bs4 import BeautifulSoup
 from utils.config import get_settings, PHARMACY_URLS
+from utils.crawling import PAGE_TIMEOUT_MS, block_heavy_resources, build_browser_pool
 from utils.logger import setup_logger, get_logger
-from storage.supabase_loader import SupabaseLoader
+from utils.parsing import HTML_PARSER, css, intern_text, json_loads, make_soup, parse_guarani
+from storage.supabase_loader import BatchWriter, SupabaseLoader
 
 # Setup logger
 setup_logger()
@@ -26,9 +35,31 @@ logger = get_logger()
 # Create router for handling different page types
 router = Router()
 
+# Product pages are server-rendered, so phase 2 fetches them over plain HTTP first
+http_router = Router[BeautifulSoupCrawlingContext]()
+
+# Product URLs the HTTP pass could not extract, retried in a real browser
+browser_fallback_urls: List[str] = []
+
 # Global db_loader instance
 db_loader_instance = None
 
+# Buffers product upserts into bulk writes (set in scrape_products())
+batch_writer_instance = None
+
+# Compiled once at import instead of looked up in re's cache on every page
+_PERCENT_RE = re.compile(r"-?(\d+)%")
+_GS_RE = re.compile(r"Gs\.\s*([\d.,]+)")
+_ITAU_RE = re.compile(r"Con\s+Ita[uú]", re.IGNORECASE)
+_FS5_RE = re.compile(r"fs-5")
+# Next.js Server Component payload: "1:{json_data}"
+_SERVER_ACTION_RE = re.compile(r'1:(\{"ok".*\})')
+_SLUG_INVALID_RE = re.compile(r"[^a-z0-9-]")
+_SLUG_DASHES_RE = re.compile(r"-+")
+
+# Phase 2 browser fallback: pages open at once across the shared browser pool
+BROWSER_CONCURRENCY = 10
+
 
 class PuntoFarmaProduct:
     """Data class for Punto Farma product extraction."""
@@ -45,11 +76,23 @@ class PuntoFarmaProduct:
         Returns:
             Dictionary with product data, or None if extraction fails
         """
-        try:
-            soup = BeautifulSoup(html, "html.parser")
+        return PuntoFarmaProduct.extract_from_soup(make_soup(html), url)
 
+    @staticmethod
+    def extract_from_soup(soup: BeautifulSoup, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Extract product data from an already parsed Punto Farma product page.
+
+        Args:
+            soup: Parsed product page
+            url: Product URL
+
+        Returns:
+            Dictionary with product data, or None if extraction fails
+        """
+        try:
             # Product name (h1)
-            product_name_elem = soup.select_one("h1")
+            product_name_elem = css("h1").select_one(soup)
             product_name = product_name_elem.get_text(strip=True) if product_name_elem else None
 
             if not product_name:
@@ -59,26 +102,26 @@ class PuntoFarmaProduct:
             # Site code and barcode from codigo div
             site_code = None
             barcode = None
-            codigo_div = soup.select_one(".codigo")
+            codigo_div = css(".codigo").select_one(soup)
             if codigo_div:
                 # Site code: "Código: 139212"
-                code_span = codigo_div.select_one("span.fw-bold.user-select-all")
+                # One pass over the selectable spans: the bold one is the code, the last the barcode
+                code_spans = css("span.user-select-all").select(codigo_div)
+                code_span = next((span for span in code_spans if "fw-bold" in span.get("class", [])), None)
                 if code_span:
                     site_code = code_span.get_text(strip=True)
 
-                # Barcode: last span with user-select-all
-                barcode_spans = codigo_div.select("span.user-select-all")
-                if len(barcode_spans) > 1:
-                    barcode = barcode_spans[-1].get_text(strip=True)
+                if len(code_spans) > 1:
+                    barcode = code_spans[-1].get_text(strip=True)
 
             # Category from breadcrumb
             category_path = []
             main_category = None
-            breadcrumb_links = soup.select("a.breadcrumb-item")
+            breadcrumb_links = css("a.breadcrumb-item").select(soup)
             for link in breadcrumb_links:
                 category_text = link.get_text(strip=True)
                 if category_text:
-                    category_path.append(category_text)
+                    category_path.append(intern_text(category_text))
 
             if category_path:
                 main_category = category_path[0]
@@ -90,27 +133,21 @@ class PuntoFarmaProduct:
             discount_amount = None
 
             # Discounted price: "Gs. 46.166"
-            discounted_price_elem = soup.select_one(".precio-con-descuento span.precio-lg")
+            discounted_price_elem = css(".precio-con-descuento span.precio-lg").select_one(soup)
             if discounted_price_elem:
-                price_text = discounted_price_elem.get_text(strip=True)
-                # Remove "Gs." and dots, extract number
-                price_match = re.search(r"[\d.]+", price_text.replace(".", ""))
-                if price_match:
-                    current_price = float(price_match.group())
+                # Integer guaraníes ("Gs. 46.166" -> 46166)
+                current_price = parse_guarani(discounted_price_elem.get_text(strip=True))
 
             # Regular price: "Gs. 56.300"
-            regular_price_elem = soup.select_one(".precio-regular del.precio-sin-descuento")
+            regular_price_elem = css(".precio-regular del.precio-sin-descuento").select_one(soup)
             if regular_price_elem:
-                price_text = regular_price_elem.get_text(strip=True)
-                price_match = re.search(r"[\d.]+", price_text.replace(".", ""))
-                if price_match:
-                    original_price = float(price_match.group())
+                original_price = parse_guarani(regular_price_elem.get_text(strip=True))
 
             # Discount percentage: "-18% de descuento"
-            discount_elem = soup.select_one(".precio-regular div[style*='background-color']")
+            discount_elem = css(".precio-regular div[style*='background-color']").select_one(soup)
             if discount_elem:
                 discount_text = discount_elem.get_text(strip=True)
-                discount_match = re.search(r"-?(\d+)%", discount_text)
+                discount_match = _PERCENT_RE.search(discount_text)
                 if discount_match:
                     discount_percentage = float(discount_match.group(1))
 
@@ -128,19 +165,19 @@ class PuntoFarmaProduct:
 
             # Image URL
             image_url = None
-            image_elem = soup.select_one("img[alt*='miniatura']")
+            image_elem = css("img[alt*='miniatura']").select_one(soup)
             if image_elem:
                 image_url = image_elem.get("src")
 
             # Brand from category link
             brand = None
-            brand_elem = soup.select_one("div > a.category[href*='/marca/']")
+            brand_elem = css("div > a.category[href*='/marca/']").select_one(soup)
             if brand_elem:
-                brand = brand_elem.get_text(strip=True)
+                brand = intern_text(brand_elem.get_text(strip=True))
 
             # Product description from accordion body
             product_description = None
-            desc_elem = soup.select_one(".atributos_body__wyXR6.accordion-body")
+            desc_elem = css(".atributos_body__wyXR6.accordion-body").select_one(soup)
             if desc_elem:
                 product_description = desc_elem.get_text(strip=True)
 
@@ -165,7 +202,7 @@ class PuntoFarmaProduct:
             h6_tags = soup.find_all("h6")
             for h6 in h6_tags:
                 h6_text = h6.get_text()
-                if re.search(r"Con\s+Ita[uú]", h6_text, re.IGNORECASE):
+                if _ITAU_RE.search(h6_text):
                     # Found bank discount section
                     # Navigate to outer container div
                     container = h6.find_parent("div", class_="d-flex")
@@ -181,16 +218,16 @@ class PuntoFarmaProduct:
 
                         # Join bank names (e.g., "Itaú QR, Itaú, Itaú Amex")
                         if bank_names:
-                            bank_discount_bank_name = ", ".join(bank_names)
+                            bank_discount_bank_name = intern_text(", ".join(bank_names))
 
                         # Extract price from span.fs-5
-                        price_span = container.find("span", class_=re.compile(r"fs-5"))
+                        price_span = container.find("span", class_=_FS5_RE)
                         if price_span:
                             price_text = price_span.get_text(strip=True)
                             # Extract price: "Gs. 31.500"
-                            price_match = re.search(r"Gs\.\s*([\d.,]+)", price_text)
+                            price_match = _GS_RE.search(price_text)
                             if price_match:
-                                bank_discount_price = float(price_match.group(1).replace(".", "").replace(",", ""))
+                                bank_discount_price = parse_guarani(price_match.group(1))
 
                         # Build bank payment offers description
                         if bank_discount_bank_name and bank_discount_price:
@@ -249,8 +286,6 @@ async def collect_urls_from_category(category_id: str, category_name: str, base_
     Returns:
         Set of unique product URLs collected
     """
-    import json
-
     api_url = f"{base_url}/categoria/{category_id}/{category_name}"
 
     # Headers required for Next.js Server Action
@@ -269,12 +304,12 @@ async def collect_urls_from_category(category_id: str, category_name: str, base_
     response = await client.post(api_url, headers=headers, content=payload)
 
     # Parse Next.js Server Component response (format: "1:{json_data}")
-    match = re.search(r'1:(\{"ok".*\})', response.text)
+    match = _SERVER_ACTION_RE.search(response.text)
     if not match:
         logger.error(f"Failed to parse API response format for category {category_id}")
         return set()
 
-    data = json.loads(match.group(1))
+    data = json_loads(match.group(1))
     total_products = data.get("total", 0)
     results_per_page = len(data.get("results", []))
 
@@ -296,12 +331,12 @@ async def collect_urls_from_category(category_id: str, category_name: str, base_
             response = await client.post(api_url, headers=headers, content=payload)
 
             # Parse response
-            match = re.search(r'1:(\{"ok".*\})', response.text)
+            match = _SERVER_ACTION_RE.search(response.text)
             if not match:
                 logger.warning(f"Failed to parse page {page} for category {category_id}")
                 continue
 
-            page_data = json.loads(match.group(1))
+            page_data = json_loads(match.group(1))
             products = page_data.get("results", [])
 
             urls_to_insert = []
@@ -315,8 +350,8 @@ async def collect_urls_from_category(category_id: str, category_name: str, base_
 
                 # Build product URL (Punto Farma format: /producto/{codigo}/{slug})
                 slug = descripcion.lower().replace(' ', '-')
-                slug = re.sub(r'[^a-z0-9-]', '', slug)  # Remove special chars
-                slug = re.sub(r'-+', '-', slug)  # Replace multiple dashes
+                slug = _SLUG_INVALID_RE.sub('', slug)  # Remove special chars
+                slug = _SLUG_DASHES_RE.sub('-', slug)  # Replace multiple dashes
                 product_url = f"{base_url}/producto/{codigo}/{slug}"
 
                 if product_url in seen_urls:
@@ -397,6 +432,39 @@ async def collect_urls_from_api() -> int:
 # PHASE 2: PRODUCT SCRAPING
 # ==============================================================================
 
+async def save_product(product_data: Dict[str, Any]) -> None:
+    """Update the product's database record (upsert on pharmacy_source + site_code)."""
+    global batch_writer_instance
+    if batch_writer_instance:
+        # Written in bulk with the rest of the batch
+        await batch_writer_instance.add_product(product_data)
+        logger.info(f"Queued: {product_data['product_name']}")
+    else:
+        logger.info(f"No DB loader: {product_data['product_name']}")
+
+
+@http_router.handler("product_detail")
+async def scrape_product_http(context: BeautifulSoupCrawlingContext) -> None:
+    """Phase 2: Scrape a product page from its server-rendered HTML."""
+    url = context.request.url
+    logger.info(f"Scraping product over HTTP: {url}")
+
+    try:
+        product_data = PuntoFarmaProduct.extract_from_soup(context.soup, url)
+
+        if product_data and product_data.get("current_price") is not None:
+            await context.push_data(product_data)
+            await save_product(product_data)
+        else:
+            logger.warning(f"Incomplete static HTML for {url}, retrying with browser")
+            browser_fallback_urls.append(url)
+
+    except Exception as e:
+        # Handled requests never reach failed_request_handler, so hand it over here
+        logger.error(f"Error scraping product {url}, retrying with browser: {e}")
+        browser_fallback_urls.append(url)
+
+
 @router.handler("product_detail")
 async def scrape_product(context: PlaywrightCrawlingContext) -> None:
     """Phase 2: Scrape product detail page and UPDATE database record."""
@@ -405,7 +473,6 @@ async def scrape_product(context: PlaywrightCrawlingContext) -> None:
     try:
         # Wait for product name to load
         await context.page.wait_for_selector("h1", timeout=10000)
-        await context.page.wait_for_timeout(1000)
 
         # Get page HTML
         html = await context.page.content()
@@ -414,16 +481,8 @@ async def scrape_product(context: PlaywrightCrawlingContext) -> None:
         product_data = PuntoFarmaProduct.extract_from_html(html, context.request.url)
 
         if product_data:
-            # Update database record (upsert based on pharmacy_source + product_url)
-            global db_loader_instance
-            if db_loader_instance:
-                product_id = await db_loader_instance.upsert_product(product_data)
-                if product_id:
-                    logger.info(f"Saved: {product_data['product_name']}")
-                else:
-                    logger.warning(f"Failed to save: {product_data['product_name']}")
-            else:
-                logger.info(f"No DB loader: {product_data['product_name']}")
+            await context.push_data(product_data)
+            await save_product(product_data)
         else:
             logger.warning(f"Failed to extract product from {context.request.url}")
 
@@ -431,6 +490,87 @@ async def scrape_product(context: PlaywrightCrawlingContext) -> None:
         logger.error(f"Error scraping product {context.request.url}: {e}")
 
 
+async def scrape_products(urls_to_scrape: List[str], proxy_configuration: Optional[ProxyConfiguration]) -> int:
+    """
+    Phase 2: Scrape product pages over HTTP, retrying failures in a browser.
+
+    Args:
+        urls_to_scrape: Product URLs to scrape
+        proxy_configuration: Optional proxy rotation
+
+    Returns:
+        Number of products scraped
+    """
+    requests = [
+        Request.from_url(url, label="product_detail") for url in urls_to_scrape
+    ]
+
+    logger.info(f"Starting scraping of {len(requests)} products over HTTP...")
+
+    http_crawler = BeautifulSoupCrawler(
+        request_handler=http_router,
+        parser=HTML_PARSER,
+        proxy_configuration=proxy_configuration,
+        max_requests_per_crawl=len(urls_to_scrape) + 100,
+        max_request_retries=2,
+        request_handler_timeout=timedelta(seconds=30),
+        concurrency_settings=ConcurrencySettings(max_concurrency=20),
+    )
+
+    @http_crawler.failed_request_handler
+    async def http_failed(context: BeautifulSoupCrawlingContext, error: Exception) -> None:
+        browser_fallback_urls.append(context.request.url)
+
+    # Both crawlers queue products into one writer; leaving it flushes the last batch
+    global batch_writer_instance
+    async with BatchWriter(db_loader_instance) as writer:
+        batch_writer_instance = writer
+        try:
+            await http_crawler.run(requests)
+
+            if browser_fallback_urls:
+                logger.info(f"Retrying {len(browser_fallback_urls)} products in the browser...")
+
+                # Separate queue: the default one already holds these URLs as handled
+                request_queue = await RequestQueue.open(name="punto-farma-browser-fallback")
+                crawler = PlaywrightCrawler(
+                    request_manager=request_queue,
+                    request_handler=router,
+                    proxy_configuration=proxy_configuration,
+                    max_requests_per_crawl=len(browser_fallback_urls) + 100,
+                    max_request_retries=2,
+                    request_handler_timeout=timedelta(seconds=30),  # 30 seconds per product page
+                    # Start high so the autoscaler doesn't sit at a low concurrency on network-bound pages
+                    concurrency_settings=ConcurrencySettings(
+                        min_concurrency=BROWSER_CONCURRENCY // 2,
+                        desired_concurrency=BROWSER_CONCURRENCY,
+                        max_concurrency=BROWSER_CONCURRENCY,
+                    ),
+                    # Pages share a few long-lived browsers instead of launching per batch
+                    browser_pool=build_browser_pool(max_open_pages=BROWSER_CONCURRENCY),
+                )
+
+                @crawler.pre_navigation_hook
+                async def block_resources(context: PlaywrightPreNavCrawlingContext) -> None:
+                    context.page.set_default_timeout(PAGE_TIMEOUT_MS)
+                    # Only markup and JSON-LD are parsed; CSS, images, fonts and trackers are skipped
+                    await block_heavy_resources(context.page)
+
+                try:
+                    await crawler.run([
+                        Request.from_url(url, label="product_detail") for url in browser_fallback_urls
+                    ])
+                finally:
+                    await request_queue.drop()
+        finally:
+            batch_writer_instance = None
+
+    # Both crawlers push extracted products to the default dataset
+    dataset = await http_crawler.get_dataset()
+    data = await dataset.get_data()
+    return len(data.items)
+
+
 # ==============================================================================
 # MAIN
 # ==============================================================================
@@ -551,30 +691,7 @@ async def main(phase: str = None) -> None:
         run_id = await db_loader.start_scraping_run("punto_farma", f"phase2_{len(urls_to_scrape)}_products")
 
         try:
-            crawler = PlaywrightCrawler(
-                request_handler=router,
-                proxy_configuration=proxy_configuration,
-                max_requests_per_crawl=len(urls_to_scrape) + 100,
-                max_request_retries=2,
-                request_handler_timeout=timedelta(seconds=30),  # 30 seconds per product page
-                concurrency_settings=ConcurrencySettings(max_concurrency=20),  # Increased concurrency for faster scraping
-                headless=True,
-                browser_launch_options={"args": ["--no-sandbox", "--disable-setuid-sandbox"]},
-            )
-
-            # Enqueue all product URLs
-            requests = [
-                Request.from_url(url, label="product_detail") for url in urls_to_scrape
-            ]
-
-            logger.info(f"Starting scraping of {len(requests)} products...")
-
-            await crawler.run(requests)
-
-            # Get final count
-            dataset = await crawler.get_dataset()
-            data = await dataset.get_data()
-            total_scraped = len(data.items)
+            total_scraped = await scrape_products(urls_to_scrape, proxy_configuration)
 
             logger.info("=" * 80)
             logger.info(f"PHASE 2 COMPLETE: {total_scraped} products scraped!")
@@ -606,30 +723,7 @@ async def main(phase: str = None) -> None:
         run_id = await db_loader.start_scraping_run("punto_farma", f"phase2_nutricion_{len(urls_to_scrape)}_products")
 
         try:
-            crawler = PlaywrightCrawler(
-                request_handler=router,
-                proxy_configuration=proxy_configuration,
-                max_requests_per_crawl=len(urls_to_scrape) + 100,
-                max_request_retries=2,
-                request_handler_timeout=timedelta(seconds=30),  # 30 seconds per product page
-                concurrency_settings=ConcurrencySettings(max_concurrency=20),  # Increased concurrency for faster scraping
-                headless=True,
-                browser_launch_options={"args": ["--no-sandbox", "--disable-setuid-sandbox"]},
-            )
-
-            # Enqueue all product URLs
-            requests = [
-                Request.from_url(url, label="product_detail") for url in urls_to_scrape
-            ]
-
-            logger.info(f"Starting scraping of {len(requests)} products...")
-
-            await crawler.run(requests)
-
-            # Get final count
-            dataset = await crawler.get_dataset()
-            data = await dataset.get_data()
-            total_scraped = len(data.items)
+            total_scraped = await scrape_products(urls_to_scrape, proxy_configuration)
 
             logger.info("=" * 80)
             logger.info(f"PHASE 2 COMPLETE: {total_scraped} products scraped!")
@@ -0,0 +1,18 @@
+-- HTTP validators for tracked product pages
+-- Lets the daily tracker skip pages that answer 304 Not Modified and carry
+-- the previous snapshot forward instead of re-rendering them
+
+CREATE TABLE IF NOT EXISTS product_http_cache (
+    product_url TEXT PRIMARY KEY,
+    pharmacy_source TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    checked_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_product_http_cache_pharmacy
+    ON product_http_cache(pharmacy_source);
+
+COMMENT ON TABLE product_http_cache IS
+    'ETag / Last-Modified of product pages as of their last successful scrape.
+     Only written after a page was parsed, so a 304 always has a snapshot to copy.';
@@ -0,0 +1,81 @@
+"""On-disk digests of extracted products, to skip unchanged upserts on re-crawls."""
+
+import hashlib
+import json
+import os
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Dict, List
+
+from utils.logger import get_logger
+
+logger = get_logger()
+
+DIGEST_CACHE_DIR = Path(os.getenv("DIGEST_CACHE_DIR", ".cache/digests"))
+
+# Re-upsert unchanged products at least this often, so the DB can't drift from the cache
+DIGEST_MAX_AGE_DAYS = int(os.getenv("DIGEST_MAX_AGE_DAYS", "7"))
+
+# Filled in by the loader on save, not extracted from the page
+_BOOKKEEPING_KEYS = ("id", "scraped_at")
+
+
+class DigestCache:
+    """Remember a digest of each product as last saved, keyed by product URL."""
+
+    def __init__(self, pharmacy_source: str, cache_dir: Path = DIGEST_CACHE_DIR):
+        """
+        Load the cache for one pharmacy.
+
+        Args:
+            pharmacy_source: Pharmacy whose products are cached
+            cache_dir: Directory holding one JSON file per pharmacy
+        """
+        self.pharmacy_source = pharmacy_source
+        self.path = cache_dir / f"{pharmacy_source}.json"
+        self.entries: Dict[str, List[str]] = {}  # url -> [digest, ISO date saved]
+        self.unchanged_site_codes: List[str] = []
+
+        if self.path.exists():
+            try:
+                self.entries = json.loads(self.path.read_text())
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable digest cache {self.path}: {e}")
+
+    @staticmethod
+    def digest(product_data: Dict[str, Any]) -> str:
+        """
+        Digest the extracted fields of a product.
+
+        Prices and stock are part of the digest, so any change to them forces an upsert.
+        """
+        fields = {k: v for k, v in product_data.items() if k not in _BOOKKEEPING_KEYS}
+        payload = json.dumps(fields, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.blake2b(payload.encode(), digest_size=8).hexdigest()
+
+    def is_unchanged(self, url: str, digest: str) -> bool:
+        """Return True if the product was saved recently with the same digest."""
+        entry = self.entries.get(url)
+        if not entry or entry[0] != digest:
+            return False
+        max_age = timedelta(days=DIGEST_MAX_AGE_DAYS)
+        return date.fromisoformat(entry[1]) >= date.today() - max_age
+
+    def mark_unchanged(self, site_code: str) -> None:
+        """Queue an unchanged product whose scraped_at should still be refreshed."""
+        if site_code:
+            self.unchanged_site_codes.append(site_code)
+
+    def mark_saved(self, url: str, digest: str) -> None:
+        """Record the digest of a product that was just upserted."""
+        self.entries[url] = [digest, date.today().isoformat()]
+
+    def mark_product_saved(self, product_data: Dict[str, Any]) -> None:
+        """Record a product that was just upserted; usable as BatchWriter(on_saved=...)."""
+        self.mark_saved(product_data["product_url"], self.digest(product_data))
+
+    def save(self) -> None:
+        """Write the cache to disk."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(self.entries))
+        logger.info(f"Saved {len(self.entries)} product digests to {self.path}")
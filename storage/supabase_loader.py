@@ -1,14 +1,56 @@
 """Supabase loader for scraped pharmaceutical data."""
 
+import asyncio
+import os
 import uuid
-from datetime import datetime
-from typing import Any, Dict, Optional
-from supabase import create_client, Client
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from supabase import create_client, Client, PostgrestAPIError
 from utils.config import get_settings
 from utils.logger import get_logger
 
 logger = get_logger()
 
+# httpx keeps at most 20 idle connections per client by default; more concurrent
+# queries than that open extra connections that are closed (TLS and all) after use
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "20"))
+
+# Dedicated threads for PostgREST calls, so they neither exceed the keep-alive pool
+# nor queue behind other asyncio.to_thread work in the default executor
+_db_executor = ThreadPoolExecutor(max_workers=SUPABASE_MAX_CONNECTIONS, thread_name_prefix="supabase")
+
+# How far back copy_latest_snapshots looks for a page's last snapshot; with 100 URLs
+# per query this bounds each response to 700 rows, under PostgREST's 1000-row cap
+SNAPSHOT_LOOKBACK_DAYS = 7
+
+# barcode_tracking_snapshots columns carried forward for unchanged pages
+SNAPSHOT_COLUMNS = (
+    "product_id, pharmacy_source, site_code, barcode, product_name, brand, product_url, "
+    "current_price, original_price, discount_percentage, discount_amount, "
+    "bank_discount_price, bank_discount_bank, in_stock, requires_prescription, snapshot_date"
+)
+
+
+@lru_cache(maxsize=None)
+def _get_client(url: str, key: str) -> Client:
+    """Create one Supabase client per URL/key and reuse it process-wide.
+
+    The client keeps a pooled keep-alive HTTP session, so sharing it avoids a
+    fresh TLS handshake for every loader instance.
+    """
+    return create_client(url, key)
+
+
+def _product_key(product: Dict[str, Any]) -> Tuple[Optional[str], str]:
+    """Return the (pharmacy_source, site_code) key of the products unique constraint.
+
+    site_code is compared as text: parsers may yield an int (e.g. a JSON-LD sku)
+    while the database always returns a string.
+    """
+    return product.get("pharmacy_source"), str(product.get("site_code"))
+
 
 class SupabaseLoader:
     """Load scraped data to Supabase database."""
@@ -23,7 +65,7 @@ class SupabaseLoader:
         settings = get_settings()
         key = settings.supabase_service_role_key or settings.supabase_key
         key_kind = "service_role" if settings.supabase_service_role_key else "anon"
-        self.client: Client = create_client(settings.supabase_url, key)
+        self.client: Client = _get_client(settings.supabase_url, key)
         logger.info(f"Supabase client initialized ({key_kind} key)")
 
     async def start_scraping_run(
@@ -75,10 +117,9 @@ class SupabaseLoader:
             product_data["scraped_at"] = datetime.utcnow().isoformat()
 
             # Upsert product (insert or update based on unique constraint)
-            result = (
+            result = await self._execute(
                 self.client.table("products")
                 .upsert(product_data, on_conflict="pharmacy_source,site_code")
-                .execute()
             )
 
             if result.data:
@@ -98,6 +139,37 @@ class SupabaseLoader:
             )
             return None
 
+    async def touch_products(self, pharmacy_source: str, site_codes: List[str]) -> int:
+        """
+        Refresh scraped_at for products that were re-scraped but had not changed.
+
+        Args:
+            pharmacy_source: Name of the pharmacy
+            site_codes: Site codes of the unchanged products
+
+        Returns:
+            Number of products touched
+        """
+        touched = 0
+        chunk_size = 100  # Keep the in.(...) filter well under URL length limits
+        scraped_at = datetime.utcnow().isoformat()
+
+        for i in range(0, len(site_codes), chunk_size):
+            chunk = site_codes[i:i + chunk_size]
+            try:
+                result = await self._execute(
+                    self.client.table("products")
+                    .update({"scraped_at": scraped_at})
+                    .eq("pharmacy_source", pharmacy_source)
+                    .in_("site_code", chunk)
+                )
+                touched += len(result.data) if result.data else 0
+            except Exception as e:
+                logger.error(f"Error touching {len(chunk)} products: {e}")
+
+        logger.info(f"Touched {touched} unchanged products")
+        return touched
+
     async def insert_product_urls(self, urls_list: list[Dict[str, Any]]) -> int:
         """
         Insert product URLs to product_urls table for Phase 1.
@@ -114,14 +186,14 @@ class SupabaseLoader:
                 return 0
 
             # Add timestamp to all records
+            created_at = datetime.utcnow().isoformat()
             for url_data in urls_list:
-                url_data["created_at"] = datetime.utcnow().isoformat()
+                url_data["created_at"] = created_at
 
             # Batch insert with upsert (on conflict: pharmacy_source, product_url)
-            result = (
+            result = await self._execute(
                 self.client.table("product_urls")
                 .upsert(urls_list, on_conflict="pharmacy_source,product_url")
-                .execute()
             )
 
             inserted = len(result.data) if result.data else 0
@@ -132,6 +204,176 @@ class SupabaseLoader:
             logger.error(f"Error inserting product URLs: {e}")
             return 0
 
+    async def insert_product_url_rows(
+        self, pharmacy_source: str, rows: list[Tuple[str, Optional[str]]]
+    ) -> int:
+        """
+        Insert Phase 1 product URLs collected as compact (product_url, site_code) tuples.
+
+        Scrapers can buffer thousands of rows without a dict per URL; the
+        JSON payload PostgREST needs is built once here, right before sending.
+
+        Args:
+            pharmacy_source: Pharmacy the URLs belong to
+            rows: (product_url, site_code) tuples
+
+        Returns:
+            Number of URLs inserted (excluding duplicates)
+        """
+        created_at = datetime.utcnow().isoformat()
+        return await self.insert_product_urls([
+            {
+                "pharmacy_source": pharmacy_source,
+                "product_url": product_url,
+                "site_code": site_code,
+                "created_at": created_at,
+            }
+            for product_url, site_code in rows
+        ])
+
+    @staticmethod
+    async def _execute(query: Any) -> Any:
+        """Run a blocking PostgREST query in a worker thread.
+
+        The Supabase client is synchronous; running bulk writes off the event
+        loop lets crawling continue while a batch is in flight. At most
+        SUPABASE_MAX_CONNECTIONS queries run at once, so every one of them
+        reuses a kept-alive connection from the shared client.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_db_executor, query.execute)
+
+    async def upsert_products_bulk(self, products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Insert or update many products in a single request.
+
+        Args:
+            products: List of product dictionaries
+
+        Returns:
+            Upserted rows (including their IDs); rows that could not be written are left out
+        """
+        if not products:
+            return []
+
+        scraped_at = datetime.utcnow().isoformat()
+        # Postgres rejects an upsert that touches the same row twice; keep the latest
+        unique_products = {}
+        for product_data in products:
+            # The unique constraint treats NULL as distinct, so a NULL site_code
+            # would insert a new zombie row on every run instead of updating one
+            if not product_data.get("site_code"):
+                logger.warning(f"Skipping upsert for {product_data.get('product_url')}: no site_code parsed")
+                continue
+            product_data.setdefault("scraped_at", scraped_at)
+            unique_products[_product_key(product_data)] = product_data
+
+        # A bulk upsert writes the union of its rows' keys and NULLs whatever a row
+        # lacks (e.g. only Catedral emits stock_available), so send each key set apart
+        by_columns: Dict[frozenset, List[Dict[str, Any]]] = {}
+        for product_data in unique_products.values():
+            by_columns.setdefault(frozenset(product_data), []).append(product_data)
+
+        rows = []
+        for group in by_columns.values():
+            rows.extend(await self._upsert_product_rows(group))
+        logger.info(f"Upserted {len(rows)} products")
+        return rows
+
+    async def _upsert_product_rows(
+        self, products: List[Dict[str, Any]], retried: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Upsert products in one request, so that one bad row or a blip never loses the batch.
+
+        A row Postgres rejects fails the whole statement, so a rejected batch is
+        split in halves until only the offending rows are dropped. Any other error
+        (timeout, connection reset) retries the batch once.
+
+        Returns:
+            Upserted rows (including their IDs)
+        """
+        try:
+            result = await self._execute(
+                self.client.table("products").upsert(products, on_conflict="pharmacy_source,site_code")
+            )
+            return result.data or []
+
+        except PostgrestAPIError as e:
+            if len(products) == 1:
+                logger.error(f"Error upserting product {products[0].get('product_url')}: {e}")
+                return []
+            middle = len(products) // 2
+            return (
+                await self._upsert_product_rows(products[:middle])
+                + await self._upsert_product_rows(products[middle:])
+            )
+
+        except Exception as e:
+            if retried:
+                logger.error(f"Error upserting {len(products)} products: {e}")
+                return []
+            logger.warning(f"Error upserting {len(products)} products, retrying: {e}")
+            await asyncio.sleep(1)
+            return await self._upsert_product_rows(products, retried=True)
+
+    async def insert_barcode_snapshots_bulk(self, products: List[Dict[str, Any]]) -> int:
+        """
+        Insert daily snapshots for many tracked products in a single request.
+
+        Args:
+            products: Product dictionaries, each including its products.id as "id"
+
+        Returns:
+            Number of snapshots written
+        """
+        if not products:
+            return 0
+
+        unique_snapshots = {}
+        for product_data in products:
+            snapshot = self._snapshot_row(product_data)
+            key = (snapshot["pharmacy_source"], snapshot["barcode"], snapshot["snapshot_date"])
+            unique_snapshots[key] = snapshot
+
+        try:
+            result = await self._execute(
+                self.client.table("barcode_tracking_snapshots").upsert(
+                    list(unique_snapshots.values()),
+                    on_conflict="pharmacy_source,barcode,snapshot_date",
+                )
+            )
+            inserted = len(result.data) if result.data else 0
+            logger.info(f"Inserted {inserted} snapshots")
+            return inserted
+
+        except Exception as e:
+            logger.error(f"Error inserting {len(unique_snapshots)} snapshots: {e}")
+            return 0
+
+    @staticmethod
+    def _snapshot_row(product_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Build a barcode_tracking_snapshots row from product data."""
+        return {
+            "product_id": product_data.get("id"),  # Product ID from products table
+            "pharmacy_source": product_data.get("pharmacy_source"),
+            "site_code": product_data.get("site_code"),
+            "barcode": product_data.get("barcode"),
+            "product_name": product_data.get("product_name"),
+            "brand": product_data.get("brand"),
+            "product_url": product_data.get("product_url"),
+            "current_price": product_data.get("current_price"),
+            "original_price": product_data.get("original_price"),
+            "discount_percentage": product_data.get("discount_percentage"),
+            "discount_amount": product_data.get("discount_amount"),
+            "bank_discount_price": product_data.get("bank_discount_price"),
+            "bank_discount_bank": product_data.get("bank_discount_bank"),
+            "in_stock": product_data.get("in_stock"),
+            "requires_prescription": product_data.get("requires_prescription"),
+            "scraped_at": product_data.get("scraped_at", datetime.utcnow().isoformat()),
+            "snapshot_date": datetime.utcnow().date().isoformat(),
+        }
+
     async def insert_barcode_snapshot(self, product_data: Dict[str, Any]) -> Optional[str]:
         """
         Insert a daily snapshot for barcode tracking campaign.
@@ -144,31 +386,12 @@ class SupabaseLoader:
             Snapshot ID if successful, None otherwise
         """
         try:
-            snapshot_data = {
-                "product_id": product_data.get("id"),  # Product ID from products table
-                "pharmacy_source": product_data.get("pharmacy_source"),
-                "site_code": product_data.get("site_code"),
-                "barcode": product_data.get("barcode"),
-                "product_name": product_data.get("product_name"),
-                "brand": product_data.get("brand"),
-                "product_url": product_data.get("product_url"),
-                "current_price": product_data.get("current_price"),
-                "original_price": product_data.get("original_price"),
-                "discount_percentage": product_data.get("discount_percentage"),
-                "discount_amount": product_data.get("discount_amount"),
-                "bank_discount_price": product_data.get("bank_discount_price"),
-                "bank_discount_bank": product_data.get("bank_discount_bank"),
-                "in_stock": product_data.get("in_stock"),
-                "requires_prescription": product_data.get("requires_prescription"),
-                "scraped_at": product_data.get("scraped_at", datetime.utcnow().isoformat()),
-                "snapshot_date": datetime.utcnow().date().isoformat(),
-            }
+            snapshot_data = self._snapshot_row(product_data)
 
             # Upsert: one snapshot per product per day
-            result = (
+            result = await self._execute(
                 self.client.table("barcode_tracking_snapshots")
                 .upsert(snapshot_data, on_conflict="pharmacy_source,barcode,snapshot_date")
-                .execute()
             )
 
             if result.data:
@@ -183,6 +406,127 @@ class SupabaseLoader:
             logger.error(f"Error inserting snapshot for {product_data.get('product_name')}: {e}")
             return None
 
+    async def get_http_cache(self, pharmacy_source: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Get cached HTTP validators (ETag / Last-Modified) for a pharmacy.
+
+        Args:
+            pharmacy_source: Name of the pharmacy
+
+        Returns:
+            Dictionary mapping product_url to its cache row
+        """
+        page_size = 1000
+        offset = 0
+        cache = {}
+
+        try:
+            while True:
+                result = await self._execute(
+                    self.client.table("product_http_cache")
+                    .select("product_url, etag, last_modified")
+                    .eq("pharmacy_source", pharmacy_source)
+                    .order("product_url")
+                    .range(offset, offset + page_size - 1)
+                )
+                rows = result.data or []
+                for row in rows:
+                    cache[row["product_url"]] = row
+                if len(rows) < page_size:
+                    return cache
+                offset += page_size
+
+        except Exception as e:
+            logger.error(f"Error getting HTTP cache: {e}")
+            return {}
+
+    async def upsert_http_cache(
+        self, pharmacy_source: str, validators: Dict[str, Dict[str, Any]]
+    ) -> int:
+        """
+        Store HTTP validators for pages that were scraped successfully.
+
+        Args:
+            pharmacy_source: Name of the pharmacy
+            validators: Dictionary mapping product_url to {"etag", "last_modified"}
+
+        Returns:
+            Number of cache rows written
+        """
+        if not validators:
+            return 0
+
+        checked_at = datetime.utcnow().isoformat()
+        rows = [
+            {
+                "product_url": url,
+                "pharmacy_source": pharmacy_source,
+                "etag": headers.get("etag"),
+                "last_modified": headers.get("last_modified"),
+                "checked_at": checked_at,
+            }
+            for url, headers in validators.items()
+        ]
+
+        try:
+            result = await self._execute(
+                self.client.table("product_http_cache").upsert(rows, on_conflict="product_url")
+            )
+            return len(result.data) if result.data else 0
+
+        except Exception as e:
+            logger.error(f"Error updating HTTP cache: {e}")
+            return 0
+
+    async def copy_latest_snapshots(self, pharmacy_source: str, product_urls: List[str]) -> set[str]:
+        """
+        Carry the most recent snapshot of unchanged pages forward to today.
+
+        Only snapshots from the last SNAPSHOT_LOOKBACK_DAYS days are considered,
+        which keeps each chunk's query under PostgREST's 1000-row cap.
+
+        Args:
+            pharmacy_source: Name of the pharmacy
+            product_urls: URLs whose pages have not changed since the last scrape
+
+        Returns:
+            URLs whose snapshot was carried forward; the rest need a real scrape
+        """
+        copied = set()
+        chunk_size = 100  # Keep the in.(...) filter well under URL length limits
+        scraped_at = datetime.utcnow().isoformat()
+        since = (datetime.utcnow().date() - timedelta(days=SNAPSHOT_LOOKBACK_DAYS)).isoformat()
+
+        for i in range(0, len(product_urls), chunk_size):
+            chunk = product_urls[i:i + chunk_size]
+            try:
+                result = await self._execute(
+                    self.client.table("barcode_tracking_snapshots")
+                    .select(SNAPSHOT_COLUMNS)
+                    .eq("pharmacy_source", pharmacy_source)
+                    .in_("product_url", chunk)
+                    .gte("snapshot_date", since)
+                    .order("snapshot_date", desc=True)
+                )
+            except Exception as e:
+                logger.error(f"Error fetching previous snapshots: {e}")
+                continue
+
+            latest = {}
+            for row in result.data or []:
+                latest.setdefault(row["product_url"], row)
+
+            snapshots = []
+            for row in latest.values():
+                row["id"] = row["product_id"]
+                row["scraped_at"] = scraped_at
+                snapshots.append(row)
+
+            if await self.insert_barcode_snapshots_bulk(snapshots):
+                copied.update(latest)
+
+        return copied
+
     async def get_urls_to_scrape(self, pharmacy_source: str, category: Optional[str] = None) -> list[str]:
         """
         Get product URLs that need scraping from product_urls table.
@@ -317,3 +661,99 @@ class SupabaseLoader:
 
         except Exception as e:
             logger.error(f"Error completing scraping run {run_id}: {e}")
+
+
+class BatchWriter:
+    """Buffer product upserts and tracking snapshots into bulk Supabase writes.
+
+    Rows are flushed when the buffer reaches batch_size or every
+    flush_interval seconds, whichever comes first. Use as an async context
+    manager so the background timer is started and the tail is flushed.
+    """
+
+    def __init__(
+        self,
+        loader: SupabaseLoader,
+        batch_size: int = 200,
+        flush_interval: float = 2.0,
+        on_saved: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        self.loader = loader
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_saved = on_saved  # Called with each product the bulk upsert returned an ID for
+        self._pending: List[tuple[Dict[str, Any], bool]] = []
+        self._timer: Optional[asyncio.Task] = None
+        # One flush at a time, so a batch swapped out of _pending is always written in full
+        self._flush_lock = asyncio.Lock()
+        self._closing = asyncio.Event()
+
+    async def __aenter__(self) -> "BatchWriter":
+        self._timer = asyncio.create_task(self._flush_periodically())
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        if self._timer:
+            # Let the timer finish a flush in progress instead of cancelling it mid-write
+            self._closing.set()
+            await self._timer
+            self._timer = None
+        await self.flush()
+
+    async def add_product(self, product_data: Dict[str, Any], snapshot: bool = False) -> None:
+        """
+        Queue a product upsert.
+
+        Args:
+            product_data: Dictionary with product information
+            snapshot: Also write a barcode tracking snapshot once the product has an ID
+        """
+        self._pending.append((product_data, snapshot))
+        if len(self._pending) >= self.batch_size:
+            await self.flush()
+
+    async def add_snapshot(self, product_data: Dict[str, Any]) -> None:
+        """Queue a product upsert followed by its daily tracking snapshot."""
+        await self.add_product(product_data, snapshot=True)
+
+    async def flush(self) -> int:
+        """
+        Write all buffered products, then snapshots for those that requested one.
+
+        Snapshots reference the product IDs returned by the bulk upsert.
+
+        Returns:
+            Number of products upserted
+        """
+        async with self._flush_lock:
+            pending, self._pending = self._pending, []
+            if not pending:
+                return 0
+
+            rows = await self.loader.upsert_products_bulk([product for product, _ in pending])
+            product_ids = {_product_key(row): row.get("id") for row in rows}
+
+            snapshots = []
+            for product_data, snapshot in pending:
+                product_id = product_ids.get(_product_key(product_data))
+                if product_id and self.on_saved:
+                    self.on_saved(product_data)
+                if snapshot and product_id:
+                    product_data["id"] = product_id
+                    snapshots.append(product_data)
+
+            await self.loader.insert_barcode_snapshots_bulk(snapshots)
+            return len(rows)
+
+    async def _flush_periodically(self) -> None:
+        """Flush on a timer so slow crawls don't hold rows indefinitely."""
+        while True:
+            try:
+                await asyncio.wait_for(self._closing.wait(), timeout=self.flush_interval)
+                return  # __aexit__ writes the tail
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing batch: {e}")
@@ -27,8 +27,9 @@ async def handle_category_listing(context: PlaywrightCrawlingContext) -> None:
         await context.page.wait_for_selector(".products", timeout=10000)
 
         # Extract all product links (but don't enqueue them for this test)
-        product_links = await context.page.locator(".product a.ecommercepro-LoopProduct-link").all()
-        logger.info(f"Found {len(product_links)} products on page")
+        # One count() round-trip instead of a locator handle per link
+        product_count = await context.page.locator(".product a.ecommercepro-LoopProduct-link").count()
+        logger.info(f"Found {product_count} products on page")
 
         # Check for pagination/next page
         next_button = context.page.locator("a.next.page-numbers").first
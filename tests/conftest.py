@@ -0,0 +1,7 @@
+"""Shared pytest setup."""
+
+import os
+
+# Scraper modules read settings at import time; tests never reach Supabase
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
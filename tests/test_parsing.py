@@ -0,0 +1,30 @@
+"""Tests for the shared HTML parsing helpers."""
+
+import pytest
+
+from utils.parsing import parse_guarani
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        ("Gs. 12.500", 12500),
+        ("₲. 59.400 *", 59400),
+        ("₲ 12.500 c/u", 12500),
+        ("12,500", 12500),
+        ("12500", 12500),
+        ("Gs.\xa074.950", 74950),
+    ],
+)
+def test_parse_guarani_reads_amount(text, expected):
+    assert parse_guarani(text) == expected
+
+
+def test_parse_guarani_reads_only_first_amount():
+    # The digits of a second amount are never glued onto the first
+    assert parse_guarani("₲ 59.400 ₲ 49.000") == 59400
+
+
+@pytest.mark.parametrize("text", [None, "", "Consultar", "₲"])
+def test_parse_guarani_without_amount(text):
+    assert parse_guarani(text) is None
@@ -0,0 +1,65 @@
+"""Tests for the pure helpers inside the pharmacy scrapers."""
+
+import pytest
+
+from scrapers.farmacia_catedral import _strip_label
+from scrapers.farmacia_center import FarmaciaCenterProduct, _url_site_code
+
+
+@pytest.mark.parametrize(
+    ("text", "label", "expected"),
+    [
+        ("CÓD.: 66", "CÓD.", "66"),
+        ("CÓD. 66", "CÓD.", "66"),
+        ("Ref. CÓD.: 123", "CÓD.", "123"),
+        ("Logo de Cooperativa Universitaria", "Logo de", "Cooperativa Universitaria"),
+        ("CÓD.:", "CÓD.", None),
+        ("66", "CÓD.", None),
+    ],
+)
+def test_strip_label(text, label, expected):
+    assert _strip_label(text, label) == expected
+
+
+def test_strip_label_barcode():
+    barcode_text = "CÓD. BARRAS: 7840036005616"
+    assert _strip_label(_strip_label(barcode_text, "CÓD.") or "", "BARRAS") == "7840036005616"
+
+
+@pytest.mark.parametrize(
+    ("url", "expected"),
+    [
+        ("https://www.farmacenter.com.py/catalogo/somero-10mg_10030893_10030893", "10030893"),
+        ("https://www.farmacenter.com.py/catalogo/somero_10030893_1", "10030893"),
+        ("https://www.farmacenter.com.py/catalogo/somero-10mg", None),
+        ("https://www.farmacenter.com.py/catalogo/somero_abc_10030893", None),
+    ],
+)
+def test_url_site_code(url, expected):
+    assert _url_site_code(url) == expected
+
+
+_JSON_VALUE = (
+    "{&quot;producto&quot;: {&quot;nombre&quot;: &quot;Somero 10mg&quot;, "
+    "&quot;marca&quot;: &quot;A &amp; B&quot;, "
+    "&quot;categoria&quot;: &quot;Medicamentos &gt; Vitaminas&quot;}}"
+)
+_URL = "https://www.farmacenter.com.py/catalogo/somero-10mg_10030893_10030893"
+
+
+@pytest.mark.parametrize(
+    "json_input",
+    [
+        # Matched straight from the raw HTML
+        f'<input type="hidden" class="json" value="{_JSON_VALUE}">',
+        # Attributes in another order: read from the parsed tree instead
+        f'<input value="{_JSON_VALUE}" type="hidden" class="json">',
+    ],
+)
+def test_center_hidden_json(json_input):
+    product = FarmaciaCenterProduct.extract_from_html(f"<html><body>{json_input}</body></html>", _URL)
+
+    assert product["product_name"] == "Somero 10mg"
+    assert product["brand"] == "A & B"
+    assert product["category_path"] == ["Medicamentos", "Vitaminas"]
+    assert product["site_code"] == "10030893"
@@ -59,6 +59,7 @@ def get_settings() -> Settings:
 PHARMACY_URLS = {
     "farma_oliva": {
         "base_url": "https://www.farmaoliva.com.py",
+        "requires_browser": True,  # Prices are filled in by JavaScript
         "categories": {
             "medicamentos": "/catalogo/medicamentos-c3",
             "suplementos": "/catalogo/suplementos-nutricionales-c5",
@@ -66,16 +67,19 @@ PHARMACY_URLS = {
     },
     "punto_farma": {
         "base_url": "https://www.puntofarma.com.py",
+        "requires_browser": False,
         "categories": {},  # TODO: Map categories
     },
     "farma_center": {
         "base_url": "https://www.farmacenter.com.py",
+        "requires_browser": False,
         "categories": {
             "medicamentos": "/medicamentos",
         },
     },
     "farmacia_catedral": {
         "base_url": "https://www.farmaciacatedral.com.py",
+        "requires_browser": False,
         "categories": {
             "medicamentos": "/categoria/1/medicamentos?marcas=&categorias=&categorias_top=",
             "suplementos": "/categoria/35/suplemento-vitaminico-y-mineral?marcas=&categorias=&categorias_top=",
@@ -0,0 +1,211 @@
+"""Shared Playwright/Crawlee setup for pharmacy crawlers."""
+
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Optional, Sequence
+from urllib.parse import urlparse
+
+from crawlee.browsers import BrowserPool, PlaywrightBrowserPlugin
+from playwright.async_api import Page, Route
+
+# Retire a browser after this many pages so long runs don't leak memory
+BROWSER_RECYCLE_PAGES = int(os.getenv("BROWSER_RECYCLE_PAGES", "100"))
+
+# Saved cookies/localStorage per site, so new contexts skip consent and anti-bot warm-up
+BROWSER_STATE_DIR = Path(os.getenv("BROWSER_STATE_DIR", ".cache/browser_state"))
+
+# Persistent Chromium profiles (HTTP cache, code cache) reused across runs
+BROWSER_CACHE_DIR = Path(os.getenv("BROWSER_CACHE_DIR", ".cache/playwright"))
+# Cap the on-disk HTTP cache of a persistent profile
+DISK_CACHE_BYTES = 512 * 1024 * 1024
+
+# Default Playwright action timeout, so a hung page frees its slot instead of starving the pool
+PAGE_TIMEOUT_MS = 30_000
+
+# Chromium flags for containers and small CI runners
+CHROMIUM_ARGS = [
+    "--no-sandbox",
+    "--disable-setuid-sandbox",
+    "--disable-dev-shm-usage",  # /dev/shm is tiny in Docker/GitHub Actions
+]
+
+# Resource types none of the parsers read
+BLOCKED_RESOURCE_TYPES = frozenset({"image", "font", "media", "stylesheet"})
+# For sites whose JS-driven rendering may depend on CSS being applied
+BLOCKED_MEDIA_TYPES = BLOCKED_RESOURCE_TYPES - {"stylesheet"}
+
+# Analytics/ads hosts that pharmacy pages pull in
+BLOCKED_TRACKER_HOSTS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "facebook.net",
+    "facebook.com",
+    "hotjar.com",
+    "clarity.ms",
+)
+
+
+def build_browser_pool(
+    max_open_pages: int = 20,
+    recycle_after_pages: int = BROWSER_RECYCLE_PAGES,
+    user_data_dir: Optional[Path] = None,
+) -> BrowserPool:
+    """
+    Build a headless Chromium pool that is recycled every N pages.
+
+    Args:
+        max_open_pages: Maximum pages open at once in a single browser
+        recycle_after_pages: Pages served before a browser is retired and replaced
+        user_data_dir: Persistent profile directory, so the HTTP cache survives between
+            runs. Chromium locks a profile, so the pool then keeps a single browser:
+            recycling is disabled and callers must keep max_concurrency <= max_open_pages.
+
+    Returns:
+        BrowserPool to pass to PlaywrightCrawler(browser_pool=...)
+    """
+    args = list(CHROMIUM_ARGS)
+    if user_data_dir:
+        args.append(f"--disk-cache-size={DISK_CACHE_BYTES}")
+        recycle_after_pages = sys.maxsize
+
+    plugin = PlaywrightBrowserPlugin(
+        browser_type="chromium",
+        user_data_dir=user_data_dir,
+        browser_launch_options={"headless": True, "args": args},
+        max_open_pages_per_browser=max_open_pages,
+    )
+    return BrowserPool(
+        plugins=[plugin],
+        retire_browser_after_page_count=recycle_after_pages,
+    )
+
+
+async def block_heavy_resources(
+    page: Page, resource_types: frozenset = BLOCKED_RESOURCE_TYPES
+) -> None:
+    """
+    Abort requests for heavy assets and third-party trackers on a page.
+
+    Call from a crawler's pre_navigation_hook so it applies before page.goto().
+
+    Args:
+        page: Playwright page about to navigate
+        resource_types: Playwright resource types to abort
+    """
+
+    async def handle_route(route: Route) -> None:
+        request = route.request
+        host = urlparse(request.url).hostname or ""
+        if request.resource_type in resource_types or host.endswith(BLOCKED_TRACKER_HOSTS):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    await page.route("**/*", handle_route)
+
+
+def browser_profile_dir(name: str) -> Path:
+    """Return the persistent Chromium profile directory used for one scraper."""
+    return BROWSER_CACHE_DIR / name
+
+
+def storage_state_path(name: str) -> Path:
+    """Return the storage state file used for one site."""
+    return BROWSER_STATE_DIR / f"{name}.json"
+
+
+async def save_storage_state(page: Page, path: Path) -> None:
+    """
+    Save the cookies and localStorage of a page's browser context.
+
+    Args:
+        page: Page that has completed a successful navigation
+        path: Destination JSON file
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    await page.context.storage_state(path=str(path))
+
+
+async def wait_for_text(page: Page, selector: str, pattern: str = r"\S", timeout: int = 5000) -> None:
+    """
+    Wait until the first element matching selector has text matching pattern.
+
+    Use for values filled in by JavaScript (e.g. prices) instead of a fixed sleep.
+
+    Args:
+        page: Playwright page
+        selector: CSS selector of the element to watch
+        pattern: JavaScript regular expression the element's text must match
+        timeout: Maximum wait in milliseconds
+    """
+    await page.wait_for_function(
+        "([selector, pattern]) => new RegExp(pattern).test(document.querySelector(selector)?.textContent || '')",
+        arg=[selector, pattern],
+        timeout=timeout,
+    )
+
+
+async def page_fragment(page: Page, selectors: Sequence[str]) -> str:
+    """
+    Return the outer HTML of the first element matching each selector, concatenated.
+
+    Cheaper than page.content() when a parser only reads a few regions: only
+    those bytes cross the Playwright bridge and get parsed. Selectors that
+    match nothing are skipped.
+
+    Args:
+        page: Playwright page
+        selectors: CSS selectors of the regions the parser reads
+
+    Returns:
+        HTML fragment string
+    """
+    return await page.evaluate(
+        "(selectors) => selectors.map((s) => document.querySelector(s)?.outerHTML || '').join('\\n')",
+        list(selectors),
+    )
+
+
+# Set on a browser context once it has received the saved state; it lives and dies
+# with the context, unlike a registry of ids, which get reused after GC
+_STATE_RESTORED_ATTR = "_pharma_state_restored"
+
+# Fills in saved localStorage entries the page's origin doesn't have yet
+_LOCAL_STORAGE_SCRIPT = """
+(origins) => {
+    const entries = origins[window.location.origin] || [];
+    for (const { name, value } of entries) {
+        if (window.localStorage.getItem(name) === null) window.localStorage.setItem(name, value);
+    }
+}
+"""
+
+
+async def restore_storage_state(page: Page, path: Path) -> None:
+    """
+    Load saved cookies and localStorage into the page's browser context, once per context.
+
+    Crawlee keeps one persistent context per browser, which cannot take
+    storage_state when created, so call this from a pre_navigation_hook.
+    Cookies are added directly; localStorage is seeded by an init script
+    that runs before the site's own scripts on every navigation.
+
+    Args:
+        page: Page about to navigate
+        path: JSON file written by save_storage_state()
+    """
+    context = page.context
+    if getattr(context, _STATE_RESTORED_ATTR, False) or not path.exists():
+        return
+    setattr(context, _STATE_RESTORED_ATTR, True)
+
+    state = json.loads(path.read_text())
+    if state.get("cookies"):
+        await context.add_cookies(state["cookies"])
+
+    origins = {o["origin"]: o["localStorage"] for o in state.get("origins", []) if o.get("localStorage")}
+    if origins:
+        await context.add_init_script(f"({_LOCAL_STORAGE_SCRIPT})({json.dumps(origins)})")
@@ -0,0 +1,108 @@
+"""Shared HTML parsing helpers for pharmacy scrapers."""
+
+import json
+import re
+import sys
+from functools import lru_cache
+from typing import Any, Optional
+
+import soupsieve
+from bs4 import BeautifulSoup, FeatureNotFound, SoupStrainer, Tag
+
+try:
+    import orjson
+except ImportError:  # Stdlib fallback for images without orjson
+    orjson = None
+
+# lxml is several times faster than the pure-Python html.parser backend
+HTML_PARSER = "lxml"
+
+
+def make_soup(html: str, parse_only: Optional[SoupStrainer] = None) -> BeautifulSoup:
+    """
+    Parse HTML with the lxml backend, falling back to html.parser if lxml is unavailable.
+
+    Args:
+        html: Page HTML
+        parse_only: Optional strainer to build only part of the tree
+
+    Returns:
+        Parsed BeautifulSoup tree
+    """
+    try:
+        return BeautifulSoup(html, HTML_PARSER, parse_only=parse_only)
+    except FeatureNotFound:
+        return BeautifulSoup(html, "html.parser", parse_only=parse_only)
+
+# A guaraní amount with its thousands separators, e.g. "59.400" in "₲. 59.400 *"
+_GUARANI_AMOUNT_RE = re.compile(r"\d[\d.,]*")
+_THOUSANDS_SEPARATORS = str.maketrans("", "", ".,")
+
+
+def parse_guarani(text: Optional[str]) -> Optional[int]:
+    """
+    Parse a guaraní amount such as "₲. 59.400 *" or "Gs. 74.950".
+
+    Guaraníes have no minor unit, so prices are whole numbers. Text around the
+    amount ("₲ 12.500 c/u") is ignored and only the first amount is read, so the
+    digits of two amounts in one element are never glued together.
+
+    Returns:
+        Price as int, or None if the text holds no amount
+    """
+    if not text:
+        return None
+    match = _GUARANI_AMOUNT_RE.search(text)
+    return int(match.group().translate(_THOUSANDS_SEPARATORS)) if match else None
+
+
+@lru_cache(maxsize=None)
+def css(selector: str) -> soupsieve.SoupSieve:
+    """
+    Compile a CSS selector once per process.
+
+    soup.select_one("...") re-parses the selector string on every call;
+    css("...").select_one(soup) reuses the compiled matcher.
+    """
+    return soupsieve.compile(selector)
+
+
+def select_text(root: Tag, selector: Optional[str]) -> Optional[str]:
+    """Return the stripped text of the first element matching selector, or None."""
+    if not selector:
+        return None
+    elem = css(selector).select_one(root)
+    return elem.get_text(strip=True) if elem else None
+
+
+def intern_text(text: Optional[str]) -> Optional[str]:
+    """
+    Intern a repeated value such as a category or brand name.
+
+    Thousands of buffered product rows then share one string object per
+    distinct value instead of holding a copy each.
+    """
+    return sys.intern(text) if isinstance(text, str) else text
+
+
+def has_any(text: Optional[str], *needles: str) -> bool:
+    """
+    Case-insensitively check whether text contains any of the needles.
+
+    The text is casefolded once for all needles; needles must already be lowercase.
+    """
+    if not text:
+        return False
+    folded = text.casefold()
+    return any(needle in folded for needle in needles)
+
+
+def json_loads(data: str | bytes) -> Any:
+    """
+    Decode JSON with orjson when available, else the stdlib.
+
+    Both backends raise a ValueError subclass on malformed input.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)